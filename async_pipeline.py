@@ -0,0 +1,132 @@
+import asyncio
+import concurrent.futures
+import time
+
+from batch_scheduler import BatchScheduler, DeckBuild, concurrent_muxes, pending_rows_per_job
+from render_jobs import create_row_executor, default_jobs
+from stage_profiler import profiling_into, run_profiled
+from tts_engine import default_max_workers
+
+pipeline_modes = ["batch", "asyncio"]
+default_pipeline_mode = "batch"
+
+
+class AsyncBatchScheduler(BatchScheduler):
+    # Same decks and reports as BatchScheduler, driven by an event loop as three stages with bounded queues
+    # between them: text to speech (blocking network calls on a thread pool), row rendering (audio assembly
+    # and encoding in the render workers) and muxing. Every stage has its own concurrency limit and a full
+    # queue holds back the stage in front of it, so row N+1 is synthesized while row N encodes and
+    # synthesized audio never piles up ahead of slow encoders. With --jobs 1 rows render on a worker thread
+    # instead of inline, so synthesis and encoding still overlap on a single core.
+
+    def __init__(self, synthesis_engine, jobs: int = default_jobs, synthesis_concurrency: int = default_max_workers):
+        super().__init__(synthesis_engine, jobs)
+        self.synthesis_concurrency = max(1, synthesis_concurrency)
+        self.render_concurrency = max(1, jobs or 1)
+
+    def run(self, plan: bool = True):
+        decks = sorted(self.decks, key=lambda deck: deck.rows_to_render())
+        self.decks = []
+        if len(decks) == 0:
+            return []
+
+        if plan:
+            self.plan_speech(decks)
+
+        return asyncio.run(self.run_stages(decks))
+
+    async def run_stages(self, decks: list):
+        start_time = time.monotonic()
+        reports = {}
+
+        synthesis_queue = asyncio.Queue(maxsize=self.synthesis_concurrency * 2)
+        render_queue = asyncio.Queue(maxsize=self.render_concurrency * pending_rows_per_job)
+        mux_queue = asyncio.Queue(maxsize=concurrent_muxes)
+
+        # rows of each deck still to be rendered, and the (row_key, future) pairs its manifest is updated from
+        remaining_rows = {deck.name: len(deck.row_tasks) for deck in decks}
+        row_futures = {deck.name: [] for deck in decks}
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.synthesis_concurrency, thread_name_prefix="pipeline-tts") as synthesis_pool, \
+                self.create_render_executor() as render_executor, \
+                concurrent.futures.ThreadPoolExecutor(max_workers=concurrent_muxes, thread_name_prefix="pipeline-mux") as mux_pool:
+            loop = asyncio.get_running_loop()
+
+            async def synthesize_rows():
+                while True:
+                    deck, task = await synthesis_queue.get()
+                    try:
+                        audio_contents = await loop.run_in_executor(synthesis_pool, self.synthesize_row, deck, task)
+                        await render_queue.put((deck, task, audio_contents))
+                    except Exception as e:
+                        # the row is handed on as failed, the deck reports it when it is muxed
+                        await render_queue.put((deck, task, e))
+                    finally:
+                        synthesis_queue.task_done()
+
+            async def render_rows():
+                while True:
+                    deck, task, audio_contents = await render_queue.get()
+                    try:
+                        if isinstance(audio_contents, Exception):
+                            row_future = concurrent.futures.Future()
+                            row_future.set_exception(audio_contents)
+                        else:
+                            row_future = render_executor.submit(run_profiled, task.render, *audio_contents, deck.scratch_dir)
+                            # failures are kept in the row's future and reported with the deck, the awaited copy's
+                            # error is retrieved here so asyncio doesn't log it as never retrieved
+                            awaited_row = asyncio.wrap_future(row_future)
+                            await asyncio.wait([awaited_row])
+                            awaited_row.exception()
+                        row_futures[deck.name].append((task.row_key, row_future))
+
+                        remaining_rows[deck.name] = remaining_rows[deck.name] - 1
+                        if remaining_rows[deck.name] == 0:
+                            await mux_queue.put(deck)
+                    finally:
+                        render_queue.task_done()
+
+            async def mux_decks():
+                while True:
+                    deck = await mux_queue.get()
+                    try:
+                        reports[deck.name] = await loop.run_in_executor(mux_pool, self.finish_deck, deck, row_futures[deck.name], start_time)
+                    finally:
+                        mux_queue.task_done()
+
+            workers = [asyncio.create_task(synthesize_rows()) for _ in range(self.synthesis_concurrency)]
+            workers += [asyncio.create_task(render_rows()) for _ in range(self.render_concurrency)]
+            workers += [asyncio.create_task(mux_decks()) for _ in range(concurrent_muxes)]
+
+            try:
+                for deck in decks:
+                    if remaining_rows[deck.name] == 0:
+                        # every row is current, the deck only needs muxing
+                        await mux_queue.put(deck)
+                    for task in deck.row_tasks.values():
+                        await synthesis_queue.put((deck, task))
+
+                await synthesis_queue.join()
+                await render_queue.join()
+                await mux_queue.join()
+            finally:
+                for worker in workers:
+                    worker.cancel()
+                await asyncio.gather(*workers, return_exceptions=True)
+
+        return [reports[deck.name] for deck in decks]
+
+    def create_render_executor(self):
+        if self.render_concurrency <= 1:
+            return concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix="pipeline-render")
+        return create_row_executor(self.jobs)
+
+    def synthesize_row(self, deck: DeckBuild, task):
+        with profiling_into(deck.profiler), deck.profiler.stage("text_to_wav"):
+            return [self.synthesis_engine.synthesize(*request) for request in task.speech]
+
+
+def create_batch_scheduler(pipeline_mode: str, synthesis_engine, jobs: int = default_jobs, synthesis_concurrency: int = default_max_workers):
+    if pipeline_mode == "asyncio":
+        return AsyncBatchScheduler(synthesis_engine, jobs, synthesis_concurrency)
+    return BatchScheduler(synthesis_engine, jobs)
@@ -0,0 +1,147 @@
+import os
+import subprocess
+import tempfile
+import uuid
+
+import imageio_ffmpeg as ffmpeg
+import numpy as np
+
+default_audio_codec = "aac"
+default_audio_bitrate = "128k"
+default_container = "mp4"
+
+# frames handed to the encoder per write, a second of 24kHz audio
+chunk_frames = 24000
+
+
+def resample(samples, from_rate: int, to_rate: int):
+    # linear interpolation, only used when a voice comes back at a different rate than the rest of the deck
+    if from_rate == to_rate:
+        return samples
+    frame_count = int(round(len(samples) * to_rate / from_rate))
+    source_positions = np.arange(frame_count) * (from_rate / to_rate)
+    source_indices = np.arange(len(samples))
+    channels = [np.interp(source_positions, source_indices, samples[:, channel]) for channel in range(samples.shape[1])]
+    return np.stack(channels, axis=1).astype(np.int16)
+
+
+class StreamingAudioEncoder:
+    # Pipes 16 bit PCM straight into a single ffmpeg process which writes the final compressed file, so
+    # memory stays flat no matter how long the track gets. The stream format is taken from the first clip,
+    # silence written before that is held back until the format is known. ffmpeg writes to a temp file next
+    # to the output that close() renames into place, abort() drops it, so a track that fails part way
+    # leaves the previous file untouched.
+
+    def __init__(
+            self,
+            output_file_path: str,
+            audio_codec: str = default_audio_codec,
+            audio_bitrate: str = default_audio_bitrate,
+            container: str = default_container
+    ):
+        self.output_file_path = output_file_path
+        self.audio_codec = audio_codec
+        self.audio_bitrate = audio_bitrate
+        self.container = container
+        self.temp_output_path = None
+
+        self.process = None
+        self.log = None
+        self.sample_rate = None
+        self.channels = None
+        self.silence_chunk = None
+        self.pending_silence_seconds = 0
+
+    def write_samples(self, samples, sample_rate: int):
+        if self.process is None:
+            self.start(sample_rate, samples.shape[1])
+
+        if samples.shape[1] != self.channels:
+            samples = samples.mean(axis=1, keepdims=True).astype(np.int16) if self.channels == 1 else np.repeat(samples[:, :1], self.channels, axis=1)
+        samples = resample(samples, sample_rate, self.sample_rate)
+
+        samples = np.ascontiguousarray(samples)
+        for start in range(0, len(samples), chunk_frames):
+            self.write_frames(samples[start:start + chunk_frames])
+
+    def write_silence(self, seconds: float):
+        if self.process is None:
+            self.pending_silence_seconds = self.pending_silence_seconds + seconds
+            return
+
+        # every pause is cut from the same precomputed chunk of zeros
+        remaining_frames = int(self.sample_rate * seconds)
+        while remaining_frames > 0:
+            frame_count = min(remaining_frames, len(self.silence_chunk))
+            self.write_frames(self.silence_chunk[:frame_count])
+            remaining_frames = remaining_frames - frame_count
+
+    def start(self, sample_rate: int, channels: int):
+        self.sample_rate = sample_rate
+        self.channels = channels
+        self.silence_chunk = np.zeros((chunk_frames, channels), dtype=np.int16)
+
+        output_directory = os.path.dirname(self.output_file_path) or "."
+        os.makedirs(output_directory, exist_ok=True)
+        self.temp_output_path = os.path.join(output_directory, f".{os.path.basename(self.output_file_path)}.{uuid.uuid4().hex}.tmp")
+
+        command = [
+            ffmpeg.get_ffmpeg_exe(), "-y", "-loglevel", "error",
+            "-f", "s16le", "-ar", str(sample_rate), "-ac", str(channels), "-i", "pipe:0",
+            "-c:a", self.audio_codec, "-b:a", self.audio_bitrate,
+            "-f", self.container, self.temp_output_path,
+        ]
+        # stderr goes to a temp file, a pipe nobody reads could fill up and stall the encoder
+        self.log = tempfile.TemporaryFile()
+        self.process = subprocess.Popen(command, stdin=subprocess.PIPE, stdout=subprocess.DEVNULL, stderr=self.log)
+
+        pending_silence_seconds = self.pending_silence_seconds
+        self.pending_silence_seconds = 0
+        self.write_silence(pending_silence_seconds)
+
+    def write_frames(self, frames):
+        try:
+            self.process.stdin.write(memoryview(frames).cast("B"))
+        except BrokenPipeError:
+            self.close()
+            raise
+
+    def close(self):
+        if self.process is None:
+            return
+
+        if not self.process.stdin.closed:
+            try:
+                self.process.stdin.close()
+            except BrokenPipeError:
+                pass
+        return_code = self.process.wait()
+
+        self.log.seek(0)
+        log_output = self.log.read().decode(errors="replace")
+        self.log.close()
+        self.process = None
+
+        if return_code != 0:
+            self.remove_temp_output()
+            raise RuntimeError(f"ffmpeg failed encoding {self.output_file_path}:\n{log_output}")
+        os.replace(self.temp_output_path, self.output_file_path)
+        self.temp_output_path = None
+
+    def abort(self):
+        # stops an encoder that wasn't closed and drops what it wrote, a no-op once the track is closed
+        if self.process is not None:
+            self.process.kill()
+            try:
+                self.process.stdin.close()
+            except BrokenPipeError:
+                pass
+            self.process.wait()
+            self.log.close()
+            self.process = None
+        self.remove_temp_output()
+
+    def remove_temp_output(self):
+        if self.temp_output_path is not None and os.path.exists(self.temp_output_path):
+            os.remove(self.temp_output_path)
+        self.temp_output_path = None
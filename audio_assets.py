@@ -0,0 +1,79 @@
+import functools
+import subprocess
+
+from build_manifest import file_digest
+
+silence_asset_path = "temp/silence.m4a"
+buffer_asset_path = "temp/buffer.m4a"
+
+# the rate moviepy mixes at, assets are decoded to it so they never need resampling
+asset_sample_rate = 44100
+asset_channels = 2
+
+# None reads the pause between phrases from silence.m4a, a number of seconds generates it instead
+synthetic_silence_seconds = None
+
+
+def configure_assets(silence_seconds: float = None):
+    # called once in the parent from the command line, and again in every render worker through asset_settings()
+    global synthetic_silence_seconds
+    synthetic_silence_seconds = silence_seconds
+    silence_audio_clip.cache_clear()
+
+
+def asset_settings():
+    return (synthetic_silence_seconds,)
+
+
+def asset_fingerprint():
+    # what the assets contribute to a row's fingerprint, changing either of them re-renders every row
+    silence = f"synthetic:{synthetic_silence_seconds}" if synthetic_silence_seconds is not None else file_digest(silence_asset_path)
+    return [silence, file_digest(buffer_asset_path)]
+
+
+@functools.lru_cache(maxsize=None)
+def decode_audio_asset(file_path: str):
+    # Decodes the whole file once per process into a read only int16 array of shape (frames, channels).
+    import imageio_ffmpeg as ffmpeg
+    import numpy as np
+
+    command = [
+        ffmpeg.get_ffmpeg_exe(), "-loglevel", "error", "-i", file_path,
+        "-f", "s16le", "-acodec", "pcm_s16le", "-ar", str(asset_sample_rate), "-ac", str(asset_channels), "pipe:1",
+    ]
+    result = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    if result.returncode != 0:
+        raise RuntimeError(f"ffmpeg failed decoding {file_path}:\n{result.stderr.decode(errors='replace')}")
+
+    samples = np.frombuffer(result.stdout, dtype="<i2").reshape(-1, asset_channels)
+    samples.flags.writeable = False
+    return samples
+
+
+@functools.lru_cache(maxsize=None)
+def synthetic_silence(seconds: float):
+    import numpy as np
+
+    samples = np.zeros((int(round(seconds * asset_sample_rate)), asset_channels), dtype=np.int16)
+    samples.flags.writeable = False
+    return samples
+
+
+# clips only read from the shared arrays, so one instance per asset can back every row of the process. numpy
+# and moviepy are only loaded here, configuring and fingerprinting the assets doesn't need them
+
+def silence_samples():
+    if synthetic_silence_seconds is not None:
+        return synthetic_silence(synthetic_silence_seconds)
+    return decode_audio_asset(silence_asset_path)
+
+
+def buffer_samples():
+    return decode_audio_asset(buffer_asset_path)
+
+
+@functools.lru_cache(maxsize=None)
+def silence_audio_clip():
+    from audio_buffers import pcm_audio_clip
+
+    return pcm_audio_clip(silence_samples(), asset_sample_rate)
@@ -0,0 +1,64 @@
+import struct
+
+import numpy as np
+
+
+def decode_wav_bytes(audio_content: bytes):
+    # Returns (samples, sample_rate) for 16 bit PCM WAV bytes such as a LINEAR16 response. samples is an
+    # int16 array of shape (frames, channels) viewing the original bytes, nothing is copied.
+    view = memoryview(audio_content)
+    if bytes(view[0:4]) != b"RIFF" or bytes(view[8:12]) != b"WAVE":
+        raise ValueError("audio content is not a WAV file")
+
+    channels = None
+    sample_rate = None
+    bits_per_sample = None
+
+    offset = 12
+    while offset + 8 <= len(view):
+        chunk_id = bytes(view[offset:offset + 4])
+        chunk_size = struct.unpack_from("<I", view, offset + 4)[0]
+        body = offset + 8
+
+        if chunk_id == b"fmt ":
+            _, channels, sample_rate = struct.unpack_from("<HHI", view, body)
+            bits_per_sample = struct.unpack_from("<H", view, body + 14)[0]
+        elif chunk_id == b"data":
+            if channels is None:
+                raise ValueError("WAV data chunk comes before the fmt chunk")
+            if bits_per_sample != 16:
+                raise ValueError(f"only 16 bit PCM WAV is supported, got {bits_per_sample} bits")
+
+            # streamed WAVs (espeak --stdout) leave a placeholder size in the header, trust the byte count instead
+            data_size = min(chunk_size, len(view) - body)
+            data_size = data_size - data_size % (2 * channels)
+            samples = np.frombuffer(audio_content, dtype="<i2", count=data_size // 2, offset=body)
+            return samples.reshape(-1, channels), sample_rate
+
+        # chunks are word aligned
+        offset = body + chunk_size + (chunk_size & 1)
+
+    raise ValueError("WAV data chunk not found")
+
+
+def pcm_audio_clip(samples, sample_rate: int):
+    # A moviepy AudioClip reading straight from an int16 sample array. Samples are only converted to
+    # floats for the frames moviepy asks for, the array itself is never copied.
+    from moviepy.audio.AudioClip import AudioClip
+
+    channels = samples.shape[1]
+
+    def make_frame(t):
+        if isinstance(t, np.ndarray):
+            indices = (t * sample_rate).astype(int)
+            in_range = (indices >= 0) & (indices < len(samples))
+            frame = np.zeros((len(t), 2))
+            frame[in_range] = samples[indices[in_range], :min(channels, 2)] / 32768.0
+            return frame
+
+        i = int(t * sample_rate)
+        if i < 0 or i >= len(samples):
+            return np.zeros(2)
+        return np.resize(samples[i, :min(channels, 2)] / 32768.0, 2)
+
+    return AudioClip(make_frame, duration=len(samples) / sample_rate, fps=sample_rate)
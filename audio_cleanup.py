@@ -0,0 +1,104 @@
+from collections import namedtuple
+
+# Text to speech clips come back with silence around the speech, and every voice at its own level. Cleanup
+# trims each clip down to its speech plus a little padding and brings the speech of every clip to the same
+# loudness, so the japanese and the english voice sit at one level and the gaps between phrases are exactly
+# the configured pauses.
+CleanupSettings = namedtuple("CleanupSettings", ["enabled", "threshold_db", "padding_seconds", "target_db", "max_gain_db"])
+
+# levels are dBFS, the loudness of a clip is the RMS of its windows above the threshold
+default_cleanup = CleanupSettings(enabled=True, threshold_db=-45.0, padding_seconds=0.05, target_db=-20.0, max_gain_db=20.0)
+
+window_seconds = 0.01
+
+# rows of the audio only path whose clips are cleaned as one batch
+cleanup_batch_rows = 64
+
+# set from the command line in the parent and in every render worker
+active_cleanup = default_cleanup
+
+
+def configure_cleanup(settings: CleanupSettings):
+    global active_cleanup
+    active_cleanup = settings
+
+
+def cleanup_settings():
+    return (active_cleanup,)
+
+
+def cleanup_fingerprint():
+    # what cleanup contributes to a row's fingerprint, changing it re-renders every row
+    return list(active_cleanup)
+
+
+def clean_clips(clips: list, sample_rates: list, settings: CleanupSettings = None):
+    # Trims and normalizes a batch of int16 (frames, channels) clips. The whole batch is measured in one
+    # pass: the clips' squared signal is concatenated once and cut into 10ms windows with reduceat, so the
+    # per clip work is a slice and a multiply. Returns new arrays, the input clips are left as they are.
+    import numpy as np
+
+    settings = settings or active_cleanup
+    if not settings.enabled:
+        return list(clips)
+
+    measured = [index for index, clip in enumerate(clips) if len(clip) > 0]
+    cleaned = list(clips)
+    if len(measured) == 0:
+        return cleaned
+
+    # window start offsets of every clip in the concatenated signal, each clip gets at least one window
+    window_lengths = [max(1, int(sample_rates[index] * window_seconds)) for index in measured]
+    window_starts = []
+    first_windows = []
+    offset = 0
+    for index, window_length in zip(measured, window_lengths):
+        first_windows.append(len(window_starts))
+        window_starts.extend(range(offset, offset + len(clips[index]), window_length))
+        offset = offset + len(clips[index])
+    window_starts = np.asarray(window_starts)
+    first_windows = np.asarray(first_windows)
+
+    # mono power of the whole batch, as floats scaled to full scale
+    power = np.concatenate([np.square(clips[index].astype(np.float32) / 32768.0).mean(axis=1) for index in measured])
+    window_energy = np.add.reduceat(power, window_starts)
+    window_sizes = np.diff(np.append(window_starts, len(power)))
+    window_rms = np.sqrt(window_energy / window_sizes)
+
+    loud = window_rms > 10 ** (settings.threshold_db / 20)
+    window_numbers = np.arange(len(window_starts)) - np.repeat(first_windows, np.diff(np.append(first_windows, len(window_starts))))
+    first_loud = np.minimum.reduceat(np.where(loud, window_numbers, np.iinfo(np.int64).max), first_windows)
+    last_loud = np.maximum.reduceat(np.where(loud, window_numbers, -1), first_windows)
+    speech_energy = np.add.reduceat(np.where(loud, window_energy, 0), first_windows)
+    speech_size = np.add.reduceat(np.where(loud, window_sizes, 0), first_windows)
+
+    # gain towards the target loudness, capped so quiet clips don't get their noise boosted and loud ones don't clip
+    speech_rms = np.sqrt(speech_energy / np.maximum(speech_size, 1))
+    gain = np.where(speech_size > 0, 10 ** (settings.target_db / 20) / np.maximum(speech_rms, 1e-9), 1.0)
+    gain = np.minimum(gain, 10 ** (settings.max_gain_db / 20))
+
+    for position, index in enumerate(measured):
+        clip = clips[index]
+        if last_loud[position] < 0:
+            # nothing but silence, keep the clip as it is rather than dropping a phrase
+            continue
+
+        window_length = window_lengths[position]
+        padding = int(sample_rates[index] * settings.padding_seconds)
+        start = max(0, first_loud[position] * window_length - padding)
+        end = min(len(clip), (last_loud[position] + 1) * window_length + padding)
+
+        speech = clip[start:end]
+        clip_gain = min(gain[position], 32767 / max(1, int(speech.max()), -int(speech.min())))
+        cleaned[index] = np.clip(np.rint(speech * clip_gain), -32768, 32767).astype(np.int16)
+
+    return cleaned
+
+
+def clean_speech(audio_contents: list):
+    # LINEAR16 text to speech responses as cleaned (samples, sample_rate) pairs, at the rate they came back in
+    from audio_buffers import decode_wav_bytes
+
+    decoded = [decode_wav_bytes(audio_content) for audio_content in audio_contents]
+    sample_rates = [sample_rate for _, sample_rate in decoded]
+    return list(zip(clean_clips([samples for samples, _ in decoded], sample_rates), sample_rates))
@@ -0,0 +1,77 @@
+import numpy as np
+
+from audio_assembler import resample
+from audio_cleanup import clean_speech
+from audio_assets import asset_channels, asset_sample_rate
+from audio_buffers import pcm_audio_clip
+
+
+def conform_samples(samples, sample_rate: int, channels: int = asset_channels, to_rate: int = asset_sample_rate):
+    # int16 samples of any rate and channel count as (frames, channels) at the timeline's rate
+    if samples.shape[1] != channels:
+        samples = samples.mean(axis=1, keepdims=True).astype(np.int16) if channels == 1 else np.repeat(samples[:, :1], channels, axis=1)
+    return resample(samples, sample_rate, to_rate)
+
+
+def samples_from_contents(audio_contents: list):
+    # text to speech responses as timeline samples, trimmed and normalized together as one batch
+    return [conform_samples(samples, sample_rate) for samples, sample_rate in clean_speech(audio_contents)]
+
+
+class AudioTimeline:
+    # Lays out audio as int16 sample arrays at one rate and channel count, with every card's start and end
+    # as exact sample offsets. Cards are built from parts (speech, silence, buffer) that are only referenced
+    # until samples() copies them into one contiguous buffer, and the video side places its card boundaries
+    # from the same offsets, so audio and video stay in sync however long the timeline gets.
+
+    def __init__(self, sample_rate: int = asset_sample_rate, channels: int = asset_channels):
+        self.sample_rate = sample_rate
+        self.channels = channels
+        self.parts = []
+        self.cards = []
+        self.card_parts = []
+        self.sample_count = 0
+
+    def add_card(self, text: str, *parts):
+        # parts are (frames, channels) int16 arrays at the timeline's rate, e.g. from samples_from_contents()
+        start = self.sample_count
+        for part in parts:
+            if part.shape[1] != self.channels:
+                raise ValueError(f"expected {self.channels} channels, got {part.shape[1]}")
+            self.parts.append(part)
+            self.sample_count = self.sample_count + len(part)
+        self.cards.append((text, start, self.sample_count))
+        self.card_parts.append(parts)
+        return len(self.cards) - 1
+
+    def samples(self):
+        return join_parts(self.parts, self.sample_count, self.channels)
+
+    def card_samples(self, card_index: int):
+        _, start, end = self.cards[card_index]
+        return join_parts(self.card_parts[card_index], end - start, self.channels)
+
+    def card_times(self):
+        # (text, start_seconds, end_seconds) for every card
+        return [(text, start / self.sample_rate, end / self.sample_rate) for text, start, end in self.cards]
+
+    def duration(self):
+        return self.sample_count / self.sample_rate
+
+    def audio_clip(self):
+        return pcm_audio_clip(self.samples(), self.sample_rate)
+
+    def card_audio_clip(self, card_index: int):
+        return pcm_audio_clip(self.card_samples(card_index), self.sample_rate)
+
+
+def join_parts(parts, sample_count: int, channels: int):
+    # one copy per part into a preallocated buffer, a single part is handed back as it is
+    if len(parts) == 1:
+        return parts[0]
+    buffer = np.empty((sample_count, channels), dtype=np.int16)
+    offset = 0
+    for part in parts:
+        buffer[offset:offset + len(part)] = part
+        offset = offset + len(part)
+    return buffer
@@ -1,19 +1,27 @@
 #!/opt/homebrew/bin/python3.10
 
-import csv
 import sys
-import wave
-import io
-import numpy as np
 import os
-import pydub as pd
-import imageio_ffmpeg as ffmpeg
 import argparse
-from moviepy.editor import *
-from PIL import Image, ImageDraw, ImageFont
-import subprocess
-
-import google.cloud.texttospeech as tts
+import shutil
+import functools
+
+# moviepy, numpy, PIL and the encoders are imported by the stages that use them, so csv only runs and
+# argument errors never pay for loading them
+from tts_cache import TTSCache, default_cache_dir, default_cache_size_mb
+from tts_engine import SynthesisEngine, synthesis_requests, default_max_workers, default_client_pool_size
+from tts_backends import SynthesisResponse, create_backend, backend_names, default_backend
+from render_jobs import deck_scratch_dir, row_scratch_dir, default_jobs
+from vocabulary_csv import VocabularyReader, PairView, general_schema, japanese_schema
+from build_manifest import row_fingerprint, renderer_version
+from audio_assets import configure_assets, asset_fingerprint, silence_audio_clip, silence_samples, buffer_samples, asset_sample_rate
+from encoding_profiles import configure_encoding, encoding_profile_from_args, encoding_fingerprint, active_encoding_profile, moviepy_write_options, named_profiles, default_encoding_profile
+from ffmpeg_runner import concat_segments, progress_printer
+from audio_cleanup import configure_cleanup, cleanup_fingerprint, clean_speech, default_cleanup, cleanup_batch_rows
+from csv_export import CsvExport, export_formats, default_export_format
+from batch_scheduler import BatchScheduler, DeckBuild, print_batch_summary, report_fields
+from async_pipeline import create_batch_scheduler, pipeline_modes, default_pipeline_mode
+from stage_profiler import profiled, record_output, current_profiler, deck_profiler, profiling_into, write_deck_reports, start_cprofile, stop_cprofile, default_report_dir
 
 german_voice = "de-DE-Standard-A"
 japanese_voice = "ja-JP-Standard-A"
@@ -23,41 +31,156 @@ english_uk_voice = "en-GB-Standard-F"
 japanese_language_code = "-".join(japanese_voice.split("-")[:2])
 english_language_code = "-".join(english_voice.split("-")[:2])
 
+# voices for the --source_language / --target_language options
+language_voices = {
+    "jp": japanese_voice,
+    "de": german_voice,
+    "en": english_voice,
+    "en-GB": english_uk_voice,
+}
+
+card_font = "wqy-microhei.ttc"
+card_font_size = 80
+card_font_color = 'white'
+
+# shared text to speech engine, set up in main()
+synthesis_engine = None
+
+# pause between phrases in the audio only output, --pause-seconds
+default_pause_seconds = 5
+pause_duration_seconds = default_pause_seconds
+
 
 def main():
     # Create an ArgumentParser object
     parser = argparse.ArgumentParser(description="JLPT script.")
 
-    csv_data = ""  # Initialize the CSV data variable
-
     parser.add_argument('-d', '--debug', action='store_true', help='Verbose Mode')
     parser.add_argument('-f', '--file',  nargs='+', help='Input filename')
     parser.add_argument('-c', '--csv', action='store_true', help='Enable csv generation')
     parser.add_argument('-r', '--reverse', action='store_true', help='Do reverse translation')
+    parser.add_argument('-a', '--audio', action='store_true', help='Enable audio only generation')
     parser.add_argument('-v', '--video', action='store_true', help='Enable video generation')
-    parser.add_argument('-s', '--source_language', help='source language present in the input file(s), jp or de')
+    parser.add_argument('-j', '--jobs', type=int, default=default_jobs, help='Number of worker processes rendering rows in parallel')
+    parser.add_argument('--pipeline', choices=pipeline_modes, default=default_pipeline_mode, help='Schedule the segment renderer deck by deck, or as asyncio stages with bounded queues between text to speech, rendering and muxing')
+    parser.add_argument('--renderer', choices=['segments', 'single-pass'], default='segments', help='Encode every segment separately and concat them, or stream the whole deck through one encoder')
+    parser.add_argument('-s', '--source_language', choices=list(language_voices), help='source language present in the input file(s), jp, de, en or en-GB')
+    parser.add_argument('-t', '--target_language', choices=list(language_voices), default='en', help='target language present in the input file(s), en by default. 3 column japanese files (kanji, kana, english) are always translated to en')
+
+    parser.add_argument('--csv-format', choices=export_formats, default=default_export_format, help='Format of the csv exports, csv.gz compresses them and parquet (needs pyarrow) writes them column wise')
+
+    parser.add_argument('--encoding-profile', choices=list(named_profiles), default=default_encoding_profile, help='Video encoding settings, still is tuned for static text cards')
+    parser.add_argument('--preset', help='x264 preset, overrides the encoding profile')
+    parser.add_argument('--crf', type=int, help='x264 constant rate factor, overrides the encoding profile')
+    parser.add_argument('--fps', type=int, help='Video frame rate, overrides the encoding profile')
+    parser.add_argument('--audio-bitrate', help='Audio bitrate of the video paths, e.g. 96k, overrides the encoding profile')
+
+    parser.add_argument('--pause-seconds', type=float, default=default_pause_seconds, help='Pause between phrases in the audio only output')
+    parser.add_argument('--no-audio-cleanup', action='store_true', help='Keep the text to speech clips as they come back instead of trimming their silence and normalizing their loudness')
+    parser.add_argument('--trim-threshold-db', type=float, default=default_cleanup.threshold_db, help='Level in dBFS below which leading and trailing audio counts as silence')
+    parser.add_argument('--target-loudness-db', type=float, default=default_cleanup.target_db, help='Loudness in dBFS every voice is normalized to')
+
+    parser.add_argument('--silence-seconds', type=float, help='Generate the pause between phrases with this length instead of reading temp/silence.m4a')
+
+    parser.add_argument('--report-dir', default=default_report_dir, help='Directory for the per deck build reports (JSON and CSV stage timings)')
+    parser.add_argument('--profile', metavar='FILE', help='Write cProfile stats of the main process to FILE')
+
+    parser.add_argument('--tts-backend', choices=backend_names, default=default_backend, help='Text to speech backend, local and espeak work offline')
+    parser.add_argument('--tts-cache-dir', default=default_cache_dir, help='Directory for the text to speech cache')
+    parser.add_argument('--tts-cache-size', type=int, default=default_cache_size_mb, help='Text to speech cache size limit in MB')
+    parser.add_argument('--no-tts-cache', action='store_true', help='Disable the text to speech cache')
+    parser.add_argument('--tts-workers', type=int, default=default_max_workers, help='Number of concurrent text to speech requests')
+    parser.add_argument('--tts-clients', type=int, default=default_client_pool_size, help='Number of pooled text to speech clients')
 
     args = parser.parse_args()
 
+    cprofile = start_cprofile(args.profile)
+
+    configure_assets(args.silence_seconds)
+    configure_cleanup(default_cleanup._replace(enabled=not args.no_audio_cleanup, threshold_db=args.trim_threshold_db, target_db=args.target_loudness_db))
+
+    global pause_duration_seconds
+    pause_duration_seconds = args.pause_seconds
+    configure_encoding(encoding_profile_from_args(args.encoding_profile, args.preset, args.crf, args.fps, args.audio_bitrate))
+
+    # the text to speech backend and its cache are only set up when there is speech to synthesize, a csv
+    # only run never loads the backend's SDK or touches the cache directory
+    global synthesis_engine
+    if args.audio is True or args.video is True:
+        tts_cache = None
+        if args.no_tts_cache is False:
+            tts_cache = TTSCache(args.tts_cache_dir, args.tts_cache_size * 1024 * 1024)
+        synthesis_engine = SynthesisEngine(create_backend(args.tts_backend, args.tts_clients), tts_cache, args.tts_workers)
+
+    # video decks of all input files are rendered together as one batch once every file is read
+    batch = create_batch_scheduler(args.pipeline, synthesis_engine, args.jobs, args.tts_workers)
+    csv_export = CsvExport(args.csv_format)
+    # audio only and single pass outputs as (output_file_path, profiler, speech, generate), run once every
+    # file is read
+    outputs = []
+    # input files that can't be translated as asked, nothing is built for them and the run fails at the end
+    rejected_files = []
+
     for input_filename in args.file:
         print("==============================================================================")
-        csv_data = get_file_csv_data(input_filename)
-        csv_file_comma_count = get_comma_count(input_filename)
-        
-        print(f"Processing file: {input_filename} with {csv_file_comma_count} commas")
-
-        if args.source_language == "jp" and csv_file_comma_count == 2:
-            run_japanese_translation_from_csv(csv_data, args, input_filename)
-        elif args.source_language == "de":
-            run_general_translation_from_csv(csv_data, args, input_filename, german_voice, english_voice)
-        elif args.source_language == "jp":
-            run_general_translation_from_csv(csv_data, args, input_filename, japanese_voice, english_voice)            
+        vocabulary = open_vocabulary(input_filename)
+
+        print(f"Processing file: {input_filename} with {vocabulary.column_count} columns")
+
+        # everything done for this file is accounted to its deck in the build report
+        deck_name = os.path.splitext(os.path.basename(input_filename))[0]
+        with vocabulary, profiling_into(deck_profiler(deck_name)):
+            if args.source_language == "jp" and vocabulary.schema == japanese_schema and args.target_language != "en":
+                print(f"Skipping {input_filename}, 3 column japanese files can only be translated to en, not {args.target_language}")
+                rejected_files.append(input_filename)
+            elif args.source_language == "jp" and vocabulary.schema == japanese_schema:
+                run_japanese_translation_from_csv(vocabulary, args, input_filename, batch, csv_export, outputs)
+            elif args.source_language in language_voices:
+                run_general_translation_from_csv(vocabulary, args, input_filename, language_voices[args.source_language], language_voices[args.target_language], batch, csv_export, outputs)
+
+        if len(vocabulary.bad_rows) > 0:
+            print(f"Skipped {len(vocabulary.bad_rows)} bad rows in {input_filename}")
+
+    # the csv exports of all input files are written together, a failed file doesn't stop the others
+    csv_succeeded = csv_export.write()
+
+    # the speech of every output of every file is planned before any of it is synthesized, so a phrase
+    # shared by several decks or outputs is synthesized once
+    if synthesis_engine is not None:
+        speech = [request for _, _, output_speech, _ in outputs for request in output_speech] + batch.speech()
+        synthesis_engine.plan(speech)
+        print(f"Planned {len(speech)} text to speech requests for {len(outputs)} outputs and {len(batch.decks)} decks, {len(set(speech))} distinct")
+
+    # an output that fails is reported without stopping the others or the batch
+    failed_outputs = []
+    for output_file_path, profiler, _, generate in outputs:
+        try:
+            with profiling_into(profiler):
+                generate()
+        except Exception as e:
+            print(f"Failed to generate {output_file_path}: {e}")
+            failed_outputs.append(output_file_path)
+    if len(failed_outputs) > 0:
+        print(f"Failed to generate {len(failed_outputs)} audio and single pass outputs")
+
+    batch_reports = batch.run(plan=False)
+    batch_succeeded = print_batch_summary(batch_reports) if len(batch_reports) > 0 else True
+
+    if synthesis_engine is not None:
+        synthesis_engine.close()
+
+    write_deck_reports(args.report_dir, {report.name: report_fields(report) for report in batch_reports})
+    stop_cprofile(cprofile, args.profile)
+
+    if len(rejected_files) > 0:
+        print(f"Skipped {len(rejected_files)} input files: {', '.join(rejected_files)}")
+
+    if not (csv_succeeded and len(failed_outputs) == 0 and batch_succeeded and len(rejected_files) == 0):
+        sys.exit(1)
 
-def get_file_csv_data(csv_file: str):
+def open_vocabulary(csv_file: str, schema: str = None):
     try:
-        with open(csv_file, 'r') as file:
-            csv_data = file.read()
-            return csv_data
+        return VocabularyReader(csv_file, schema)
     except FileNotFoundError:
         print(f"File '{csv_file}' not found.")
         sys.exit(1)
@@ -65,28 +188,10 @@ def get_file_csv_data(csv_file: str):
         print(f"An error occurred: {str(e)}")
         sys.exit(1)
 
-def get_comma_count(csv_file: str):
-    # Initialize a variable to store the comma count for the first line
-    first_line_comma_count = 0
-
-    # Open the CSV file for reading
-    with open(csv_file, 'r') as file:
-        # Read the first line
-        first_line = file.readline()
-
-        # Count the number of commas in the first line
-        first_line_comma_count = first_line.count(',')
-    return first_line_comma_count    
-
-def reverse_pairs_in_list(list_to_reverse: list):
-    return [(pair[1], pair[0]) for pair in list_to_reverse]
-
-def run_general_translation_from_csv(csv_data: str, args, input_filename, source_voice: str, target_voice: str):
-    # Split the CSV data into rows
-    rows = csv_data.strip().split('\n')
-
-    # extract the source to target data
-    source_to_target_list = [row.split(',')[0:2] for row in rows]
+def run_general_translation_from_csv(vocabulary: VocabularyReader, args, input_filename, source_voice: str, target_voice: str, batch: BatchScheduler, csv_export: CsvExport, outputs: list):
+    # the entries are held once, the source to target data is a view onto the first two columns of any csv
+    entries = list(vocabulary.rows(general_schema))
+    source_to_target_list = PairView(entries, "source", "target")
 
     if args.debug is True:
         # Print the source to target list
@@ -96,30 +201,32 @@ def run_general_translation_from_csv(csv_data: str, args, input_filename, source
     input_filename_without_extension = os.path.splitext(os.path.basename(input_filename))[0]
 
     if args.csv is True:
-        generate_output_csv("source_to_target_csv/" + input_filename_without_extension, source_to_target_list)
+        csv_export.add("source_to_target_csv/" + input_filename_without_extension, source_to_target_list)
 
-   # if args.audio is True:
-   #     generate_audio(source_to_target_list, input_filename_without_extension)    
+    if args.reverse is True and (args.audio is True or args.video is True):
+        target_to_source_list = source_to_target_list.reversed()
+        input_filename_without_extension = input_filename_without_extension + "_reversed"
+        print(f"Reversed the source to target list")
+        source_to_target_list = target_to_source_list
+        source_voice, target_voice = target_voice, source_voice
+
+    if args.audio is True:
+        speech = synthesis_requests(source_to_target_list, source_voice, target_voice)
+        outputs.append((f"audio/{input_filename_without_extension}.mp4", current_profiler(), speech, functools.partial(generate_audio, source_to_target_list, input_filename_without_extension, source_voice, target_voice)))
 
     if args.video is True:
-        if args.reverse is True:
-            target_to_source_list = reverse_pairs_in_list(source_to_target_list)
-            input_filename_without_extension = input_filename_without_extension + "_reversed"
-            print(f"Reversed the source to target list")
-            generate_video_v2(target_to_source_list, input_filename_without_extension, target_voice, source_voice)
+        if args.renderer == "single-pass":
+            speech = synthesis_requests(source_to_target_list, source_voice, target_voice)
+            outputs.append((f"video/{input_filename_without_extension}.mp4", current_profiler(), speech, functools.partial(generate_video_v2_single_pass, source_to_target_list, input_filename_without_extension, source_voice, target_voice)))
         else:
-            generate_video_v2(source_to_target_list, input_filename_without_extension, source_voice, target_voice)
-
+            batch.add(plan_video_v2(source_to_target_list, input_filename_without_extension, source_voice, target_voice))
 
-def run_japanese_translation_from_csv(csv_data: str, args, input_filename):
-    # Split the CSV data into rows
-    rows = csv_data.strip().split('\n')
 
-    # Extract the kana to english data
-    kana_to_english_result_list = [row.split(',')[1:3] for row in rows]
-
-    # extract the kanji to kana data
-    kanji_to_kana_result_list = [row.split(',')[0:2] for row in rows]
+def run_japanese_translation_from_csv(vocabulary: VocabularyReader, args, input_filename, batch: BatchScheduler, csv_export: CsvExport, outputs: list):
+    # the entries are held once, the kana to english and kanji to kana data are views onto them
+    entries = list(vocabulary.rows(japanese_schema))
+    kana_to_english_result_list = PairView(entries, "kana", "english")
+    kanji_to_kana_result_list = PairView(entries, "kanji", "kana")
 
     if args.debug is True:
     # Print the result list
@@ -131,133 +238,125 @@ def run_japanese_translation_from_csv(csv_data: str, args, input_filename):
     input_filename_without_extension = os.path.splitext(os.path.basename(input_filename))[0]
 
     if args.csv is True:
-        generate_output_csv("kana_to_english_csv/" + input_filename_without_extension, kana_to_english_result_list)
-        generate_output_csv("kanji_to_kana_csv/" + input_filename_without_extension, kanji_to_kana_result_list)
+        csv_export.add("kana_to_english_csv/" + input_filename_without_extension, kana_to_english_result_list)
+        csv_export.add("kanji_to_kana_csv/" + input_filename_without_extension, kanji_to_kana_result_list)
 
-    # if args.audio is True:
-    #    generate_audio(kana_to_english_result_list, input_filename_without_extension)    
+    if args.audio is True:
+        if args.reverse is True:
+            print("Reversed the kana to english list")
+            english_to_kana_result_list = kana_to_english_result_list.reversed()
+            speech = synthesis_requests(english_to_kana_result_list, english_voice, japanese_voice)
+            outputs.append((f"audio/{input_filename_without_extension}_reversed.mp4", current_profiler(), speech, functools.partial(generate_audio, english_to_kana_result_list, input_filename_without_extension + "_reversed", english_voice, japanese_voice)))
+        else:
+            speech = synthesis_requests(kana_to_english_result_list, japanese_voice, english_voice)
+            outputs.append((f"audio/{input_filename_without_extension}.mp4", current_profiler(), speech, functools.partial(generate_audio, kana_to_english_result_list, input_filename_without_extension, japanese_voice, english_voice)))
 
     if args.video is True:
-        generate_japanese_video(kana_to_english_result_list, kanji_to_kana_result_list, input_filename_without_extension) 
+        if args.renderer == "single-pass":
+            speech = synthesis_requests(kana_to_english_result_list, japanese_voice, english_voice)
+            outputs.append((f"video/{input_filename_without_extension}.mp4", current_profiler(), speech, functools.partial(generate_japanese_video_single_pass, entries, input_filename_without_extension)))
+        else:
+            batch.add(plan_japanese_video(entries, input_filename_without_extension))
 
 
 
+@profiled("text_to_wav")
 def text_to_wav(text: str, language_code: str, voice_name: str):
-    audio_config = tts.AudioConfig(audio_encoding=tts.AudioEncoding.LINEAR16)
-    text_input = tts.SynthesisInput(text=text)
-    voice_params = tts.VoiceSelectionParams(
-        language_code=language_code, name=voice_name
-    )
-    client = tts.TextToSpeechClient()
     print(f"running text to speech for {text}")
-    response = client.synthesize_speech(
-        input=text_input,
-        voice=voice_params,
-        audio_config=audio_config,
-    )
-    return response
-
-
-def generate_output_csv(output_file_path: str, result_list: list):
-
-    # Extract the directory path from the file path
-    directory_path = os.path.dirname(output_file_path)
-
-    # Check if the directory exists, and create it if it doesn't
-    if not os.path.exists(directory_path):
-        os.makedirs(directory_path)
-
-    # Write the result list to a CSV file
-    try:
-        with open(output_file_path + ".csv", 'w', newline='') as csvfile:
-            csvwriter = csv.writer(csvfile)
-            for item in result_list:
-                csvwriter.writerow(item)
-        print(f"Generated - {output_file_path}.csv")
-    except Exception as e:
-        print(f"An error occurred: {str(e)}")
-        sys.exit(1)
-
-
-def generate_image(text: str):
-    # Create a blank image with a white background
-    width, height = 800, 600  # Adjust the dimensions as needed
-    background_color = (255, 255, 255)  # White
-    image = Image.new("RGB", (width, height), background_color)
-
-    # Create a drawing context
-    draw = ImageDraw.Draw(image)
+    audio_content = synthesis_engine.synthesize(text, language_code, voice_name)
+    return SynthesisResponse(audio_content)
 
-    # Choose a font and font size
-    font_path = "path/to/your/font.ttf"  # Specify the path to your font file
-    font_size = 36
-   # font = ImageFont.truetype(font_path, font_size)
 
-    # Choose text color
-    text_color = (0, 0, 0)  # Black
+def video_v2_segment_files(row_key):
+    # segments 0 and 3 are the blank card shared by every row, see blank_segment_file()
+    return [f"output_{row_key}_{intermediate_file_index}.mp4" for intermediate_file_index in (1, 2, 4, 5)]
 
-    # Calculate the position to center the text
-    text_width, text_height = draw.textsize(text)
-    x = (width - text_width) / 2
-    y = (height - text_height) / 2
+def blank_segment_file(segment_key):
+    return f"blank_{segment_key}.mp4"
 
-    # Write the text on the image
-    draw.text((x, y), text, fill=text_color, align="center")
+def japanese_video_segment_files(row_key):
+    return [f"output_{row_key}_1.mp4", f"output_{row_key}_2.mp4"]
 
-    # Save the image
-    output_filename = "text_image.png"  # Specify the output filename
-    image.save(output_filename)
+def video_segment_files(row_key):
+    return [f"output_{row_key}.mp4"]
 
-def generate_input_file_to_ffmpeg_v2(list_length, num_intermediate_files):
-    with open("temp/ffmpeg_list", "wb") as out: 
-        for index in range(list_length):
-            for intermediate_file_index in range(num_intermediate_files):
-                out.write(f"file 'output_{index}_{intermediate_file_index}.mp4'\n".encode())
+def segment_list_v2(row_keys, blank_segment):
+    segment_files = []
+    for row_key in row_keys:
+        for intermediate_file_index in range(6):
+            if intermediate_file_index in (0, 3):
+                segment_files.append(blank_segment)
+            else:
+                segment_files.append(f"output_{row_key}_{intermediate_file_index}.mp4")
+    return segment_files
 
-def generate_input_file_to_ffmpeg_for_jap(list_length):
-    with open("temp/ffmpeg_list", "wb") as out: 
-        for index in range(list_length):
-            out.write(f"file 'output_{index}_1.mp4'\n".encode())
-            out.write(f"file 'output_{index}_2.mp4'\n".encode())
+def segment_list_for_jap(row_keys):
+    return [segment_file for row_key in row_keys for segment_file in japanese_video_segment_files(row_key)]
 
 
-def generate_input_file_to_ffmpeg(list_length):
-    with open("temp/ffmpeg_list", "wb") as out: 
-        for index in range(list_length):
-            out.write(f"file 'output_{index}.mp4'\n".encode())
+def segment_list(row_keys):
+    # the segments of every row in deck order, as concat_segments() joins them
+    return [segment_file for row_key in row_keys for segment_file in video_segment_files(row_key)]
 
+@profiled("load_clip", child_processes=True)
 def generate_silence_audio_clip(
         
 ):
-    silence_audio_clip = AudioFileClip("temp/silence.m4a")    
-    print(f"silence audio duration {silence_audio_clip.duration}")
-    return silence_audio_clip
+    # decoded once per process and shared by every row
+    silence_audio = silence_audio_clip()
+    print(f"silence audio duration {silence_audio.duration}")
+    return silence_audio
     
-def generate_buffer_audio_clip(
-        
+@profiled("load_clip", child_processes=True)
+def generate_samples_from_contents(*audio_contents: bytes):
+    from audio_timeline import samples_from_contents
+
+    # decoded straight from the response bytes, trimmed and normalized together and brought to the
+    # timeline's rate, no temp file involved
+    samples = samples_from_contents(audio_contents)
+    print(f"audio clip durations {[len(clip_samples) / asset_sample_rate for clip_samples in samples]}")
+    return samples
+
+def generate_word_pair_samples(
+        source_text: str,
+        target_text: str,
+        source_voice: str,
+        target_voice: str
 ):
-    silence_audio_clip = AudioFileClip("temp/buffer.m4a")    
-    print(f"buffer audio duration {silence_audio_clip.duration}")
-    return silence_audio_clip    
-
-def generate_word_audio_clip(
-        text: str,
-        voice: str
+    source_language_code = "-".join(source_voice.split("-")[:2])
+    target_language_code = "-".join(target_voice.split("-")[:2])
+    source_audio = text_to_wav(source_text, source_language_code, source_voice)
+    target_audio = text_to_wav(target_text, target_language_code, target_voice)
+    return generate_samples_from_contents(source_audio.audio_content, target_audio.audio_content)
+
+def sequenced_audio_parts(
+        source_audio_content: bytes,
+        target_audio_content: bytes,
+        prefix_silence: bool
 ):
-    voice_language_code = "-".join(voice.split("-")[:2])
-    audio = text_to_wav(text, voice_language_code, voice)
-    with open("temp/temp_audio.wav", "wb") as out:
-        out.write(audio.audio_content)
-        out.close()
+    # the source and target audio with the gaps between them, as parts of a card on an AudioTimeline
+    source_samples, target_samples = generate_samples_from_contents(source_audio_content, target_audio_content)
+    silence = silence_samples()
 
-    audio_clip = AudioFileClip("temp/temp_audio.wav")
-    print(f"audio clip duration {audio_clip.duration}")
-    return audio_clip
+    # prefix silence for the first clip
+    if (prefix_silence):
+        return [silence, source_samples, silence, target_samples, silence]
 
-    # return AudioFileClip("temp/temp_audio.wav")
-    # return audio_clip.set_duration(audio_clip.duration + 1)
+    return [source_samples, silence, target_samples, silence]
 
-def generate_word_and_translation_sequenced_audio_clip(
+def generate_sequenced_audio_clip(
+        source_audio_content: bytes,
+        target_audio_content: bytes,
+        prefix_silence: bool
+):
+    from audio_timeline import AudioTimeline
+
+    # combine the source and target audio into a single clip which has the image showing in it as video
+    timeline = AudioTimeline()
+    timeline.add_card(None, *sequenced_audio_parts(source_audio_content, target_audio_content, prefix_silence))
+    return timeline.audio_clip()
+
+def generate_word_and_translation_audio_parts(
         jap_text: str, 
         english_text: str, 
         prefix_silence: bool, 
@@ -271,227 +370,345 @@ def generate_word_and_translation_sequenced_audio_clip(
     source_audio = text_to_wav(jap_text, source_language_code, source_voice)
     target_audio = text_to_wav(english_text, target_language_code, target_voice)  
 
-    with open("temp/temp_source.wav", "wb") as out:
-        out.write(source_audio.audio_content)
-        out.close()
-    with open("temp/temp_target.wav", "wb") as out:
-        out.write(target_audio.audio_content)
+    return sequenced_audio_parts(source_audio.audio_content, target_audio.audio_content, prefix_silence)
 
-    # open the temp jap file and temp english audio files and combine the two audio files into a single mp4 file which has
-    # the image showing in it as video
-    # Load the two audio files
-    source_audio_clip = AudioFileClip("temp/temp_source.wav")
-    target_audio_clip = AudioFileClip("temp/temp_target.wav")
-    silence_audio_clip = AudioFileClip("temp/silence.m4a")
-
-    # prefix silence for the first clip
-    if (prefix_silence):
-        return concatenate_audioclips([silence_audio_clip, source_audio_clip, silence_audio_clip, target_audio_clip, silence_audio_clip])
+def rasterize_text_card(word_text):
+    from text_cards import render_text_card
 
-    # Concatenate the audio clips with the gap
-    return concatenate_audioclips([source_audio_clip, silence_audio_clip, target_audio_clip, silence_audio_clip])
+    return render_text_card(word_text, card_font, card_font_size, card_font_color)
 
+@profiled("text_clip")
 def generate_text_clip(word_text, duration):
-    font_size = 50
-    font_color = 'white'
-    position = 'center' 
-    font = "wqy-microhei.ttc"
+    from moviepy.video.VideoClip import ImageClip
 
-    txt_clip = TextClip(word_text, size=(0, 100), color=font_color, font=font)
-    txt_clip = txt_clip.set_position(position).set_duration(duration)
+    # the card is rasterized once per distinct text and held as a still frame for the whole duration
+    txt_clip = ImageClip(rasterize_text_card(word_text))
+    txt_clip = txt_clip.set_duration(duration)
 
     return txt_clip
 
 
 def generate_empty_text_clip():
+    from moviepy.video.VideoClip import ImageClip
+    from text_cards import render_text_card
+
     font_size = 50
     font_color = 'white'
-    position = 'center' 
     font = "wqy-microhei.ttc"
 
-    empty_txt_clip = TextClip("~", fontsize=font_size, color=font_color, font=font)
-    silence_audio = AudioFileClip("temp/silence.m4a")
-    empty_txt_clip = empty_txt_clip.set_position(position).set_duration(silence_audio.duration)
+    silence_audio = silence_audio_clip()
+    empty_txt_clip = ImageClip(render_text_card("~", font, font_size, font_color))
+    empty_txt_clip = empty_txt_clip.set_duration(silence_audio.duration)
     return empty_txt_clip
 
-def run_ffmpeg_command(ouput_file_name_without_extension):
+def segment_render_settings():
+    from video_renderer import default_canvas_size
+
+    # everything apart from the row's own text and voices that ends up in a rendered segment
+    return [
+        renderer_version,
+        synthesis_engine.backend.name,
+        card_font, card_font_size, card_font_color, default_canvas_size,
+        *asset_fingerprint(),
+        *encoding_fingerprint(),
+        *cleanup_fingerprint(),
+    ]
+
+@profiled("write_segment", child_processes=True)
+def write_segment(video_clip, segment_file_path: str, row_dir: str, audio_file: str = None):
+    if audio_file is not None:
+        # the soundtrack was encoded once already and is shared with another segment of the row, ffmpeg copies it in
+        video_clip.write_videofile(segment_file_path, audio=audio_file, **moviepy_write_options(active_encoding_profile()))
+        record_output("write_segment", segment_file_path)
+        return
+
+    # keep moviepy's temporary audio file inside the row's scratch directory, by default it lands in the
+    # working directory under a name derived from the segment and would collide between decks
+    temp_audiofile = os.path.join(row_dir, os.path.splitext(os.path.basename(segment_file_path))[0] + "_audio.mp3")
+    video_clip.write_videofile(segment_file_path, temp_audiofile=temp_audiofile, **moviepy_write_options(active_encoding_profile()))
+    record_output("write_segment", segment_file_path)
+
+@profiled("write_shared_audio", child_processes=True)
+def write_shared_audio(audio_clip, row_dir: str):
+    # same settings write_videofile uses for its own temporary audio file, so the segments stay concat compatible
+    audio_file = os.path.join(row_dir, "shared_audio.mp3")
+    audio_clip.write_audiofile(audio_file, fps=44100, nbytes=4, codec="libmp3lame", bitrate=active_encoding_profile().audio_bitrate)
+    record_output("write_shared_audio", audio_file)
+    return audio_file
+
+@profiled("concat", child_processes=True)
+def run_ffmpeg_command(ouput_file_name_without_extension, segment_files, scratch_dir="temp"):
 
     file_path = f"video/{ouput_file_name_without_extension}.mp4"
-    if os.path.exists(file_path):
-        os.remove(file_path)
-        print(f"File {file_path} has been removed.")
 
-    command = f'ffmpeg -f concat -safe 0 -i temp/ffmpeg_list -c copy {file_path}'
-    # Run the command in a subprocess
-    try:
-        result = subprocess.run(command, shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, check=True)
-        # Print the standard output of the command
-        print("Command output:")
-        print(result.stdout)
-    
-    except subprocess.CalledProcessError as e:
-        # If the command returns a non-zero exit code, it will raise a CalledProcessError
-        print("Error running the command:")
-        print(e)
+    # the previous video is only replaced once the new one is complete, a failed mux raises and fails the deck
+    concat_segments(segment_files, file_path, scratch_dir, progress_printer(f"Muxing {file_path}"))
+    record_output("concat", file_path)
+    print(f"Generated - {file_path} from {len(segment_files)} segments")
+
+def render_japanese_video_row(
+        row_key: str,
+        prefix_silence: bool,
+        kanji_text: str,
+        kana_text: str,
+        source_audio_content: bytes,
+        target_audio_content: bytes,
+        scratch_dir: str
+):
+    row_dir = row_scratch_dir(scratch_dir, row_key)
 
-def generate_japanese_video(kana_to_english_result_list: list, kanji_to_kana_result_list: list, ouput_file_name_without_extension: str): 
+    sequenced_audio = generate_sequenced_audio_clip(source_audio_content, target_audio_content, prefix_silence)
+
+    # the kanji and the kana segment play the same audio, mix and encode it once for both of them
+    shared_audio_file = write_shared_audio(sequenced_audio, row_dir)
+
+    kanji_txt_clip = generate_text_clip(kanji_text, sequenced_audio.duration)
+    write_segment(kanji_txt_clip, f"{scratch_dir}/output_{row_key}_1.mp4", row_dir, shared_audio_file)
+
+    kana_txt_clip = generate_text_clip(kana_text, sequenced_audio.duration)
+    write_segment(kana_txt_clip, f"{scratch_dir}/output_{row_key}_2.mp4", row_dir, shared_audio_file)
+
+    shutil.rmtree(row_dir, ignore_errors=True)
+    print(f"Done with video for {kanji_text} {kana_text}")
+
+def plan_japanese_video(entries: list, ouput_file_name_without_extension: str):
+    deck = DeckBuild(ouput_file_name_without_extension, japanese_video_segment_files, segment_list_for_jap, run_ffmpeg_command)
+
+    # fingerprint every row, only rows whose inputs changed since the last build are rendered again
     ix = 0
+    for entry in entries:
+        row = (ix == 0, entry.kanji, entry.kana, entry.english)
+        row_key = row_fingerprint("japanese", row, japanese_voice, english_voice, segment_render_settings())
 
-    for item in kana_to_english_result_list:
+        speech = [(entry.kana, japanese_language_code, japanese_voice), (entry.english, english_language_code, english_voice)]
+        deck.add_row(row_key, speech, functools.partial(render_japanese_video_row, row_key, ix == 0, entry.kanji, entry.kana))
 
-        sequenced_audio = generate_word_and_translation_sequenced_audio_clip(item[0], item[1], ix == 0, japanese_voice, english_voice)
-        kanji_text = kanji_to_kana_result_list[ix][0]
-        kanji_txt_clip = generate_text_clip(kanji_text, sequenced_audio.duration)
+        ix = ix + 1
 
-        # Combine the text and audio clips into a single video track
-        combined_video = CompositeVideoClip([kanji_txt_clip.set_audio(sequenced_audio)])
-        combined_video.write_videofile(f"temp/output_{ix}_1.mp4", fps=25)    
+    return deck
 
-        kana_text = kanji_to_kana_result_list[ix][1]
-        kana_txt_clip = generate_text_clip(kana_text, sequenced_audio.duration)
 
-        combined_video = CompositeVideoClip([kana_txt_clip.set_audio(sequenced_audio)])
-        combined_video.write_videofile(f"temp/output_{ix}_2.mp4", fps=25)    
+def render_video_v2_row(
+        row_key: str,
+        source_text: str,
+        target_text: str,
+        source_audio_content: bytes,
+        target_audio_content: bytes,
+        scratch_dir: str
+):
+    from audio_timeline import AudioTimeline
 
-        print(f"Done with video for {kanji_text} {kana_text}")
+    row_dir = row_scratch_dir(scratch_dir, row_key)
 
-        ix = ix + 1    
+    print(f"Generating video for {source_text}")
 
-    generate_input_file_to_ffmpeg_for_jap(len(kana_to_english_result_list))
-    run_ffmpeg_command(ouput_file_name_without_extension)
+    # the row's four cards on one timeline, the blank segments 0 and 3 are rendered once per deck
+    source_samples, target_samples = generate_samples_from_contents(source_audio_content, target_audio_content)
 
+    timeline = AudioTimeline()
+    timeline.add_card(source_text, source_samples)
+    timeline.add_card(source_text, buffer_samples())
+    timeline.add_card(target_text, target_samples)
+    timeline.add_card(target_text, buffer_samples())
 
-def generate_video_v2(source_to_target_list: list, ouput_file_name_without_extension: str, source_voice: str, target_voice: str): 
-    ix = 0
+    # Attach each card's audio to its still text card, held for exactly as many samples as the audio lasts
+    for card_index, (text, start_seconds, end_seconds) in enumerate(timeline.card_times()):
+        card_video = generate_text_clip(text, end_seconds - start_seconds).set_audio(timeline.card_audio_clip(card_index))
+        write_segment(card_video, f"{scratch_dir}/output_{row_key}_{(1, 2, 4, 5)[card_index]}.mp4", row_dir)
 
-    for item in source_to_target_list:
+    shutil.rmtree(row_dir, ignore_errors=True)
+    print(f"Done with video for {source_text}")
+
+def render_blank_segment(segment_file: str, scratch_dir: str):
+    row_dir = row_scratch_dir(scratch_dir, os.path.splitext(segment_file)[0])
+
+    # a blank card over silence, written with the same settings as every other segment so concat can copy it
+    silence_audio = generate_silence_audio_clip()
+    blank_video = generate_text_clip(" ", silence_audio.duration).set_audio(silence_audio)
+    write_segment(blank_video, f"{scratch_dir}/{segment_file}", row_dir)
+
+    shutil.rmtree(row_dir, ignore_errors=True)
+    print(f"Done with blank segment {segment_file}")
+
+def plan_video_v2(source_to_target_list: list, ouput_file_name_without_extension: str, source_voice: str, target_voice: str):
+    blank_segment_key = row_fingerprint("blank", segment_render_settings())
+    blank_segment = blank_segment_file(blank_segment_key)
 
+    deck = DeckBuild(ouput_file_name_without_extension, video_v2_segment_files, functools.partial(segment_list_v2, blank_segment=blank_segment), run_ffmpeg_command)
+    deck.add_shared_segment(blank_segment_key, [blank_segment], functools.partial(render_blank_segment, blank_segment))
+
+    source_language_code = "-".join(source_voice.split("-")[:2])
+    target_language_code = "-".join(target_voice.split("-")[:2])
+
+    # fingerprint every row, only rows whose inputs changed since the last build are rendered again
+    for item in source_to_target_list:
         source_text = item[0]
         target_text = item[1]
+        row_key = row_fingerprint("v2", (source_text, target_text), source_voice, target_voice, segment_render_settings())
 
-        print(f"Generating video for {source_text}")
+        speech = [(source_text, source_language_code, source_voice), (target_text, target_language_code, target_voice)]
+        deck.add_row(row_key, speech, functools.partial(render_video_v2_row, row_key, source_text, target_text))
 
-        source_audio = generate_word_audio_clip(source_text, source_voice)
-        source_txt_clip = generate_text_clip(source_text, source_audio.duration)
+    return deck
 
-        silence_audio_prefix = generate_silence_audio_clip()
-        silence_txt_clip_prefix = generate_text_clip(" ", silence_audio_prefix.duration)
-        silence_audio_middle = generate_silence_audio_clip()        
-        silence_txt_clip_middle = generate_text_clip(" ", silence_audio_middle.duration)  
+@profiled("single_pass_render", child_processes=True)
+def generate_japanese_video_single_pass(entries: list, ouput_file_name_without_extension: str):
+    ix = 0
+    scratch_dir = deck_scratch_dir(ouput_file_name_without_extension)
 
-        middle_buffer_audio = generate_buffer_audio_clip()
-        middle_buffer_txt_clip = generate_text_clip(source_text, middle_buffer_audio.duration)
+    # the deck was planned with the rest of the run, synthesis runs a window of rows ahead of the loop below
+    requests = synthesis_requests(PairView(entries, "kana", "english"), japanese_voice, english_voice)
 
-        suffix_buffer_audio = generate_buffer_audio_clip()
-        suffix_buffer_txt_clip = generate_text_clip(target_text, suffix_buffer_audio.duration)
+    from audio_timeline import AudioTimeline
+    from video_renderer import SinglePassRenderer
 
-        target_audio = generate_word_audio_clip(target_text, target_voice)
-        target_txt_clip = generate_text_clip(target_text, target_audio.duration)
+    renderer = SinglePassRenderer(f"video/{ouput_file_name_without_extension}.mp4", f"{scratch_dir}/single_pass", profile=active_encoding_profile())
 
-        # Combine the text and audio clips into a single video track
-        
-        prefix_video = CompositeVideoClip([silence_txt_clip_prefix.set_audio(silence_audio_prefix)])
-        prefix_video.write_videofile(f"temp/output_{ix}_0.mp4", fps=25)    
+    for entry in entries:
+        synthesis_engine.prefetch_window(requests, 2 * ix)
 
-        source_video = CompositeVideoClip([source_txt_clip.set_audio(source_audio)])
-        source_video.write_videofile(f"temp/output_{ix}_1.mp4", fps=25)    
+        sequenced_audio = generate_word_and_translation_audio_parts(entry.kana, entry.english, ix == 0, japanese_voice, english_voice)
+        kanji_text = entry.kanji
+        kana_text = entry.kana
 
-        middle_buffer_video = CompositeVideoClip([middle_buffer_txt_clip.set_audio(middle_buffer_audio)])
-        middle_buffer_video.write_videofile(f"temp/output_{ix}_2.mp4", fps=25)        
+        # the kanji and the kana card play the same audio
+        timeline = AudioTimeline()
+        timeline.add_card(kanji_text, *sequenced_audio)
+        timeline.add_card(kana_text, *sequenced_audio)
+        renderer.add_timeline(timeline)
 
-        middle_video = CompositeVideoClip([silence_txt_clip_middle.set_audio(silence_audio_middle)])
-        middle_video.write_videofile(f"temp/output_{ix}_3.mp4", fps=25)    
+        print(f"Done with audio for {kanji_text} {kana_text}")
 
-        target_video = CompositeVideoClip([target_txt_clip.set_audio(target_audio)])
-        target_video.write_videofile(f"temp/output_{ix}_4.mp4", fps=25)            
+        ix = ix + 1
 
-        suffix_buffer_video = CompositeVideoClip([suffix_buffer_txt_clip.set_audio(suffix_buffer_audio)])
-        suffix_buffer_video.write_videofile(f"temp/output_{ix}_5.mp4", fps=25)            
+    renderer.render(rasterize_text_card)
+    record_output("single_pass_render", renderer.output_file_path)
 
-        print(f"Done with video for {source_text}")
 
-        ix = ix + 1    
+@profiled("single_pass_render", child_processes=True)
+def generate_video_v2_single_pass(source_to_target_list: list, ouput_file_name_without_extension: str, source_voice: str, target_voice: str):
+    scratch_dir = deck_scratch_dir(ouput_file_name_without_extension)
 
-    generate_input_file_to_ffmpeg_v2(len(source_to_target_list), 6)
-    run_ffmpeg_command(ouput_file_name_without_extension)
+    # the deck was planned with the rest of the run, synthesis runs a window of rows ahead of the loop below
+    requests = synthesis_requests(source_to_target_list, source_voice, target_voice)
 
-def generate_video(source_to_target_list: list, ouput_file_name_without_extension: str, source_voice: str, target_voice: str): 
-    ix = 0
+    from audio_timeline import AudioTimeline
+    from video_renderer import SinglePassRenderer
 
-    for item in source_to_target_list:
+    renderer = SinglePassRenderer(f"video/{ouput_file_name_without_extension}.mp4", f"{scratch_dir}/single_pass", profile=active_encoding_profile())
+
+    for index, item in enumerate(source_to_target_list):
+        synthesis_engine.prefetch_window(requests, 2 * index)
 
         source_text = item[0]
         target_text = item[1]
 
-        sequenced_audio = generate_word_and_translation_sequenced_audio_clip(source_text, target_text, ix == 0, source_voice, target_voice)
-        source_txt_clip = generate_text_clip(source_text, sequenced_audio.duration)
-
-        # Combine the text and audio clips into a single video track
-        combined_video = CompositeVideoClip([source_txt_clip.set_audio(sequenced_audio)])
-        combined_video.write_videofile(f"temp/output_{ix}.mp4", fps=25)    
+        print(f"Generating video for {source_text}")
 
-        print(f"Done with video for {source_text}")
+        source_samples, target_samples = generate_word_pair_samples(source_text, target_text, source_voice, target_voice)
+
+        # same card sequence as generate_video_v2
+        timeline = AudioTimeline()
+        timeline.add_card(" ", silence_samples())
+        timeline.add_card(source_text, source_samples)
+        timeline.add_card(source_text, buffer_samples())
+        timeline.add_card(" ", silence_samples())
+        timeline.add_card(target_text, target_samples)
+        timeline.add_card(target_text, buffer_samples())
+        renderer.add_timeline(timeline)
+
+    renderer.render(rasterize_text_card)
+    record_output("single_pass_render", renderer.output_file_path)
+
+def render_video_row(
+        row_key: str,
+        prefix_silence: bool,
+        source_text: str,
+        source_audio_content: bytes,
+        target_audio_content: bytes,
+        scratch_dir: str
+):
+    row_dir = row_scratch_dir(scratch_dir, row_key)
 
-        ix = ix + 1    
+    sequenced_audio = generate_sequenced_audio_clip(source_audio_content, target_audio_content, prefix_silence)
+    source_txt_clip = generate_text_clip(source_text, sequenced_audio.duration)
 
-    generate_input_file_to_ffmpeg(len(source_to_target_list))
-    run_ffmpeg_command(ouput_file_name_without_extension)
+    # Attach the audio to the still text card
+    combined_video = source_txt_clip.set_audio(sequenced_audio)
+    write_segment(combined_video, f"{scratch_dir}/output_{row_key}.mp4", row_dir)
 
-def generate_audio(kana_to_english_result_list: list,ouput_file_name_without_extension: str): 
+    shutil.rmtree(row_dir, ignore_errors=True)
+    print(f"Done with video for {source_text}")
 
-    pause_duration_seconds = 5
+def plan_video(source_to_target_list: list, ouput_file_name_without_extension: str, source_voice: str, target_voice: str):
+    deck = DeckBuild(ouput_file_name_without_extension, video_segment_files, segment_list, run_ffmpeg_command)
 
-    print(f"Generating audio for {ouput_file_name_without_extension}")
-    combined_audio = wave.open(f"wav/{ouput_file_name_without_extension}.wav", 'wb')
-    combined_audio_params_set = False
+    source_language_code = "-".join(source_voice.split("-")[:2])
+    target_language_code = "-".join(target_voice.split("-")[:2])
 
+    # fingerprint every row, only rows whose inputs changed since the last build are rendered again
     ix = 0
-    for item in kana_to_english_result_list:
-        japanese_audio = text_to_wav(item[0], japanese_language_code, japanese_voice)
-        english_audio = text_to_wav(item[1], english_language_code, english_voice)  
-
-        with open("temp_jap", "wb") as out:
-            out.write(japanese_audio.audio_content)
-            out.close()
-        with open("temp_english", "wb") as out:
-            out.write(english_audio.audio_content)
-            out.close()
-
-        japanese_audio_wav = wave.open("temp_jap", 'rb')
-        english_audio_wav = wave.open("temp_english", 'rb')
-
-        japanese_audio_data = japanese_audio_wav.readframes(1000024)
-        english_audio_data = english_audio_wav.readframes(1000024)    
-
-        reference_params = japanese_audio_wav.getparams()
-
-        pause_frames = int(reference_params.framerate * pause_duration_seconds)    
-        zero_frames = np.zeros(reference_params.nchannels * reference_params.sampwidth * pause_frames, dtype=np.uint8)
-
-        if combined_audio_params_set == False:
-            combined_audio.setparams(reference_params)                  # Set the parameters for the output WAV file
-            combined_audio_params_set = True
-            combined_audio.writeframes(zero_frames.tobytes())   # add 5 seconds of silence
-        combined_audio.writeframes(japanese_audio_data)     # write the japanese audio
-        combined_audio.writeframes(zero_frames.tobytes())   # add 5 seconds of silence
-        combined_audio.writeframes(english_audio_data)      # write the english audio 
-        combined_audio.writeframes(zero_frames.tobytes())   # add 5 seconds of silence
-
-        japanese_audio_wav.close()
-        japanese_audio_wav.close()
-        print(f"finished writing {item[0]}:{item[1]}")
+    for item in source_to_target_list:
+        source_text = item[0]
+        target_text = item[1]
+        row_key = row_fingerprint("sequenced", (ix == 0, source_text, target_text), source_voice, target_voice, segment_render_settings())
+
+        speech = [(source_text, source_language_code, source_voice), (target_text, target_language_code, target_voice)]
+        deck.add_row(row_key, speech, functools.partial(render_video_row, row_key, ix == 0, source_text))
+
         ix = ix + 1
 
-    combined_audio.close()    
+    return deck
+
+@profiled("generate_audio", child_processes=True)
+def generate_audio(source_to_target_list: list, ouput_file_name_without_extension: str, source_voice: str, target_voice: str): 
+    # audio only fast path, nothing in here goes near moviepy or a video encoder
+
+    print(f"Generating audio for {ouput_file_name_without_extension}")
 
-    # remove the temp_jap and temp_english files
-    os.remove("temp_jap")
-    os.remove("temp_english")
+    from audio_assembler import StreamingAudioEncoder
 
-    # convert wav file to mp4
-    sound = pd.AudioSegment.from_wav(f"wav/{ouput_file_name_without_extension}.wav")
-    sound.export(f"audio/{ouput_file_name_without_extension}.mp4", format="mp4")
-    print(f"finished generating mp4 file - mp4/{ouput_file_name_without_extension}.mp4")
+    # the pcm is piped straight into the encoder, there is no intermediate wav file
+    combined_audio = StreamingAudioEncoder(f"audio/{ouput_file_name_without_extension}.mp4")
+
+    source_language_code = "-".join(source_voice.split("-")[:2])
+    target_language_code = "-".join(target_voice.split("-")[:2])
+
+    # the deck was planned with the rest of the run, synthesis runs up to a batch of rows ahead of the batch
+    # being encoded
+    requests = synthesis_requests(source_to_target_list, source_voice, target_voice)
+
+    # the encoder is stopped and its temp file dropped if the deck fails part way, the previous file stays
+    try:
+        combined_audio.write_silence(pause_duration_seconds)        # add the pause
+
+        # the clips are trimmed and normalized a batch of rows at a time
+        for batch_start in range(0, len(source_to_target_list), cleanup_batch_rows):
+            rows = source_to_target_list[batch_start:batch_start + cleanup_batch_rows]
+            synthesis_engine.prefetch_window(requests, 2 * batch_start)
+
+            audio_contents = []
+            for item in rows:
+                audio_contents.append(text_to_wav(item[0], source_language_code, source_voice).audio_content)
+                audio_contents.append(text_to_wav(item[1], target_language_code, target_voice).audio_content)
+            clips = clean_speech(audio_contents)
+
+            for row_index, item in enumerate(rows):
+                source_samples, source_sample_rate = clips[2 * row_index]
+                target_samples, target_sample_rate = clips[2 * row_index + 1]
+
+                combined_audio.write_samples(source_samples, source_sample_rate)      # write the source audio
+                combined_audio.write_silence(pause_duration_seconds)        # add the pause
+                combined_audio.write_samples(target_samples, target_sample_rate)      # write the target audio
+                combined_audio.write_silence(pause_duration_seconds)        # add the pause
+
+                print(f"finished writing {item[0]}:{item[1]}")
+
+        combined_audio.close()
+    finally:
+        combined_audio.abort()
+    record_output("generate_audio", f"audio/{ouput_file_name_without_extension}.mp4")
+    print(f"finished generating mp4 file - audio/{ouput_file_name_without_extension}.mp4")
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,194 @@
+import concurrent.futures
+import time
+from collections import namedtuple
+
+from build_manifest import BuildManifest
+from render_jobs import create_row_executor, deck_scratch_dir, default_jobs
+from stage_profiler import deck_profiler, profiling_into, run_profiled
+
+# speech holds the (text, language_code, voice) requests synthesized in the parent, render is called in a
+# worker as render(*audio_contents, scratch_dir) and writes the row's segments
+RowTask = namedtuple("RowTask", ["row_key", "speech", "render"])
+
+DeckReport = namedtuple("DeckReport", ["name", "rows", "rendered", "reused", "seconds", "error"])
+
+# decks muxed at the same time, a mux is a -c copy ffmpeg process and mostly waits on the disk
+concurrent_muxes = 2
+
+# rows handed to the render workers but not finished yet, per worker. Keeps the synthesized audio waiting
+# in the executor's queue bounded on big batches.
+pending_rows_per_job = 4
+
+
+class DeckBuild:
+    # One deck's segment rendering, planned against its build manifest: every row of the deck in order, the
+    # rows that still need rendering, and how the segments are muxed into the deck's video at the end.
+
+    def __init__(self, name: str, segment_files_for_row, segment_list, concat):
+        self.name = name
+        self.scratch_dir = deck_scratch_dir(name)
+        self.manifest = BuildManifest(self.scratch_dir)
+        self.profiler = deck_profiler(name)
+        self.segment_files_for_row = segment_files_for_row
+        self.segment_list = segment_list
+        self.concat = concat
+
+        self.row_keys = []
+        self.shared_keys = []
+        self.segment_files = {}
+        self.row_tasks = {}
+        self.current_keys = set()
+
+    def add_row(self, row_key: str, speech: list, render):
+        self.row_keys.append(row_key)
+        self.add_task(row_key, self.segment_files_for_row(row_key), speech, render)
+
+    def add_shared_segment(self, segment_key: str, segment_files: list, render):
+        # a segment that is identical for every row, like a blank filler card. It is rendered once per deck and
+        # the segment list references it wherever a row needs it.
+        self.shared_keys.append(segment_key)
+        self.add_task(segment_key, segment_files, [], render)
+
+    def add_task(self, key: str, segment_files: list, speech: list, render):
+        self.segment_files[key] = segment_files
+        if key in self.row_tasks or key in self.current_keys:
+            return
+        if self.manifest.is_current(key, segment_files):
+            self.current_keys.add(key)
+            return
+        self.row_tasks[key] = RowTask(key, speech, render)
+
+    def rows_to_render(self):
+        return len([key for key in self.row_tasks if key not in self.shared_keys])
+
+    def rows_reused(self):
+        # rows whose segments the manifest already had, a row repeated within the deck counts once
+        return len([key for key in self.current_keys if key not in self.shared_keys])
+
+    def speech(self):
+        return [request for task in self.row_tasks.values() for request in task.speech]
+
+    def finish(self, row_futures: list):
+        self.manifest.record_rows(row_futures, self.segment_files.get)
+        self.manifest.save(self.row_keys + self.shared_keys)
+        self.concat(self.name, self.segment_list(self.row_keys), self.scratch_dir)
+
+
+class BatchScheduler:
+    # Runs the decks of every input file as one batch. Text to speech runs a deck ahead of rendering, the rows
+    # of all decks go through a single pool of render workers, and each deck is muxed on a mux thread as
+    # soon as its last row is done, so no stage sits idle at a file boundary.
+
+    def __init__(self, synthesis_engine, jobs: int = default_jobs):
+        self.synthesis_engine = synthesis_engine
+        self.jobs = jobs
+        self.decks = []
+
+    def add(self, deck: DeckBuild):
+        if any(existing.name == deck.name for existing in self.decks):
+            print(f"Skipping deck {deck.name}, a deck with the same name is already part of this batch")
+            return
+        print(f"Planned deck {deck.name}: {deck.rows_to_render()} of {len(deck.row_keys)} rows to render")
+        self.decks.append(deck)
+
+    def speech(self):
+        return [request for deck in self.decks for request in deck.speech()]
+
+    def plan_speech(self, decks: list):
+        # plan the speech of the whole batch up front, a phrase shared by several rows or decks is synthesized
+        # once and handed to every row that needs it
+        speech = [request for deck in decks for request in deck.speech()]
+        self.synthesis_engine.plan(speech)
+        print(f"Planned {len(speech)} text to speech requests for {len(decks)} decks, {len(set(speech))} distinct")
+
+    def run(self, plan: bool = True):
+        # smallest decks first, finished videos come out early and one long deck doesn't hold up the rest
+        decks = sorted(self.decks, key=lambda deck: deck.rows_to_render())
+        self.decks = []
+        if len(decks) == 0:
+            return []
+
+        start_time = time.monotonic()
+        max_pending_rows = max(1, self.jobs or 1) * pending_rows_per_job
+
+        # plan=False when the batch's speech was already planned together with the other outputs of the run
+        if plan:
+            self.plan_speech(decks)
+
+        with create_row_executor(self.jobs) as executor, concurrent.futures.ThreadPoolExecutor(max_workers=concurrent_muxes) as muxer:
+            deck_futures = []
+            pending_rows = set()
+
+            # the speech of every row in the order it is synthesized below. Synthesis runs a window of requests
+            # ahead of the row being handed to the render workers, across deck boundaries, so the audio waiting
+            # in memory stays bounded however big the decks are.
+            speech = [request for deck in decks for request in deck.speech()]
+            deck_position = 0
+            for deck in decks:
+                row_futures = []
+                position = deck_position
+                for task in deck.row_tasks.values():
+                    with profiling_into(deck.profiler):
+                        self.synthesis_engine.prefetch_window(speech, position)
+                    position = position + len(task.speech)
+                    try:
+                        with profiling_into(deck.profiler), deck.profiler.stage("text_to_wav"):
+                            audio_contents = [self.synthesis_engine.synthesize(*request) for request in task.speech]
+                    except Exception as e:
+                        # the row is recorded as failed and the rest of the deck is skipped, the deck reports the
+                        # error when it is finished and the other decks carry on
+                        failed_row = concurrent.futures.Future()
+                        failed_row.set_exception(e)
+                        row_futures.append((task.row_key, failed_row))
+                        break
+
+                    if len(pending_rows) >= max_pending_rows:
+                        _, pending_rows = concurrent.futures.wait(pending_rows, return_when=concurrent.futures.FIRST_COMPLETED)
+
+                    # the worker measures its stages for the row and hands them back with the result
+                    row_future = executor.submit(run_profiled, task.render, *audio_contents, deck.scratch_dir)
+                    pending_rows.add(row_future)
+                    row_futures.append((task.row_key, row_future))
+
+                deck_futures.append(muxer.submit(self.finish_deck, deck, row_futures, start_time))
+                deck_position = deck_position + len(deck.speech())
+
+            return [deck_future.result() for deck_future in deck_futures]
+
+    def finish_deck(self, deck: DeckBuild, row_futures: list, start_time: float):
+        error = None
+        try:
+            with profiling_into(deck.profiler):
+                deck.finish(row_futures)
+        except Exception as e:
+            error = e
+
+        for _, row_future in row_futures:
+            if row_future.done() and row_future.exception() is None:
+                deck.profiler.merge(row_future.result())
+
+        report = DeckReport(deck.name, len(deck.row_keys), deck.rows_to_render(), deck.rows_reused(), time.monotonic() - start_time, error)
+        if error is None:
+            print(f"Finished deck {report.name}: {report.rows} rows, {report.rendered} rendered, {report.reused} reused, done after {report.seconds:.1f}s")
+        else:
+            print(f"Failed deck {report.name} after {report.seconds:.1f}s: {error}")
+        return report
+
+
+def report_fields(report: DeckReport):
+    # the batch outcome of a deck as plain values for its build report
+    return {
+        "rows": report.rows,
+        "rendered": report.rendered,
+        "reused": report.reused,
+        "seconds": report.seconds,
+        "error": None if report.error is None else str(report.error),
+    }
+
+
+def print_batch_summary(reports: list):
+    failed = [report for report in reports if report.error is not None]
+    print(f"Built {len(reports) - len(failed)} of {len(reports)} decks")
+    for report in failed:
+        print(f"  {report.name} failed: {report.error}")
+    return len(failed) == 0
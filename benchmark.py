@@ -0,0 +1,220 @@
+#!/usr/bin/env python3
+
+import argparse
+import csv
+import datetime
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import imageio_ffmpeg as ffmpeg
+
+repo_dir = os.path.dirname(os.path.abspath(__file__))
+
+default_sizes = [10, 100, 1000]
+default_results_file = "benchmarks/results.jsonl"
+default_seed = 1
+
+# script, extra arguments and deck schema for every benchmarked entry point
+benchmark_cases = {
+    "jlpt": ("jlpt.py", [], "japanese"),
+    "babel_fish-jp": ("babel_fish.py", ["-s", "jp"], "japanese"),
+    "babel_fish-general": ("babel_fish.py", ["-s", "de"], "general"),
+}
+
+path_flags = {
+    "csv": "-c",
+    "audio": "-a",
+    "video": "-v",
+}
+
+# output directories the scripts write to, relative to the working directory
+output_dirs = ["audio", "video", "kana_to_english_csv", "kanji_to_kana_csv", "source_to_target_csv"]
+
+kanji_pool = "日本語学校先生時間電車会社友達天気料理写真映画音楽新聞仕事病院銀行食堂駅前"
+kana_pool = "あいうえおかきくけこさしすせそたちつてとなにぬねのはひふへほまみむめもやゆよらりるれろわをん"
+latin_words = [
+    "house", "dog", "cat", "tree", "train", "teacher", "weather", "music", "newspaper", "station",
+    "Haus", "Hund", "Katze", "Baum", "Zug", "Lehrer", "Wetter", "Musik", "Zeitung", "Bahnhof",
+]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the csv, audio and video paths on synthetic decks.")
+
+    parser.add_argument('--sizes', type=int, nargs='+', default=default_sizes, help='Deck sizes in rows')
+    parser.add_argument('--cases', nargs='+', choices=list(benchmark_cases), default=list(benchmark_cases), help='Entry points to benchmark')
+    parser.add_argument('--paths', nargs='+', choices=list(path_flags), default=list(path_flags), help='Pipeline paths to benchmark')
+    parser.add_argument('-j', '--jobs', type=int, default=1, help='Render worker processes passed to the scripts')
+    parser.add_argument('--renderer', choices=['segments', 'single-pass'], default='segments', help='Video renderer passed to the scripts')
+    parser.add_argument('--seed', type=int, default=default_seed, help='Seed for the synthetic decks')
+    parser.add_argument('--label', default=None, help='Name of this run in the results file, the current commit by default')
+    parser.add_argument('--results', default=default_results_file, help='JSON lines file the results are appended to')
+    parser.add_argument('--compare', metavar='LABEL', help='Compare this run against an earlier run in the results file')
+    parser.add_argument('--max-regression', type=float, default=0.2, help='Fail when rows/sec drops by more than this fraction against --compare')
+
+    args = parser.parse_args()
+
+    label = args.label or git_commit() or datetime.datetime.now().strftime("%Y%m%d%H%M%S")
+
+    results = []
+    for case in args.cases:
+        for path in args.paths:
+            for size in args.sizes:
+                result = run_case(case, path, size, args.jobs, args.renderer, args.seed)
+                result["label"] = label
+                results.append(result)
+                append_result(args.results, result)
+                print(f"{case:20} {path:6} {size:6} rows  {result['rows_per_second']:8.2f} rows/s  "
+                      f"{result['peak_rss_mb']:8.1f} MB peak  {result['output_bytes']:10} bytes  exit {result['returncode']}")
+
+    if args.compare is not None:
+        if not compare_results(load_results(args.results, args.compare), results, args.max_regression):
+            sys.exit(1)
+
+    if any(result["returncode"] != 0 for result in results):
+        sys.exit(1)
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=repo_dir, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def generate_deck(file_path: str, schema: str, size: int, seed: int):
+    # mixed kana, kanji and latin text, the same seed always produces the same deck
+    rng = random.Random(f"{seed}-{schema}-{size}")
+    with open(file_path, "w", newline="") as deck_file:
+        writer = csv.writer(deck_file)
+        for ix in range(size):
+            kana = "".join(rng.choice(kana_pool) for _ in range(rng.randint(2, 6)))
+            kanji = "".join(rng.choice(kanji_pool) for _ in range(rng.randint(1, 3))) + kana[-1]
+            english = " ".join(rng.choice(latin_words) for _ in range(rng.randint(1, 3))) + f" {ix}"
+            if schema == "japanese":
+                writer.writerow([kanji, kana, english])
+            else:
+                writer.writerow([rng.choice(latin_words) + f" {ix}", english])
+
+
+def prepare_workdir(workdir: str):
+    # the scripts read their timing assets from temp/, a missing buffer.m4a is generated as a second of silence
+    os.makedirs(os.path.join(workdir, "temp"))
+    shutil.copy(os.path.join(repo_dir, "temp", "silence.m4a"), os.path.join(workdir, "temp", "silence.m4a"))
+
+    buffer_asset_path = os.path.join(repo_dir, "temp", "buffer.m4a")
+    if os.path.exists(buffer_asset_path):
+        shutil.copy(buffer_asset_path, os.path.join(workdir, "temp", "buffer.m4a"))
+    else:
+        subprocess.run([
+            ffmpeg.get_ffmpeg_exe(), "-loglevel", "error", "-f", "lavfi", "-i", "anullsrc=r=44100:cl=stereo",
+            "-t", "1", "-c:a", "aac", os.path.join(workdir, "temp", "buffer.m4a"),
+        ], check=True)
+
+
+def output_bytes(workdir: str):
+    total = 0
+    for output_dir in output_dirs:
+        for dir_path, _, file_names in os.walk(os.path.join(workdir, output_dir)):
+            total = total + sum(os.path.getsize(os.path.join(dir_path, file_name)) for file_name in file_names)
+    return total
+
+
+def run_case(case: str, path: str, size: int, jobs: int, renderer: str, seed: int):
+    script, case_args, schema = benchmark_cases[case]
+
+    with tempfile.TemporaryDirectory(prefix="jlpt-benchmark-") as workdir:
+        prepare_workdir(workdir)
+        os.makedirs(os.path.join(workdir, "video"))
+        deck_file_path = os.path.join(workdir, f"bench_{size}.csv")
+        generate_deck(deck_file_path, schema, size, seed)
+
+        command = [
+            sys.executable, os.path.join(repo_dir, script), "-f", deck_file_path, path_flags[path], *case_args,
+            "--tts-backend", "local", "--no-tts-cache", "-j", str(jobs), "--renderer", renderer,
+            "--report-dir", os.path.join(workdir, "reports"),
+        ]
+
+        start_time = time.perf_counter()
+        with open(os.path.join(workdir, "benchmark.log"), "w") as log:
+            process = subprocess.Popen(command, cwd=workdir, stdout=log, stderr=subprocess.STDOUT)
+            # wait4 reports the peak RSS of the script and of the render workers and encoders it waited for
+            _, status, rusage = os.wait4(process.pid, 0)
+            process.returncode = os.waitstatus_to_exitcode(status)
+        wall_seconds = time.perf_counter() - start_time
+
+        if process.returncode != 0:
+            with open(os.path.join(workdir, "benchmark.log")) as log:
+                print(log.read()[-2000:])
+
+        return {
+            "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+            "case": case,
+            "path": path,
+            "rows": size,
+            "jobs": jobs,
+            "renderer": renderer,
+            "seed": seed,
+            "python": sys.version.split()[0],
+            "wall_seconds": round(wall_seconds, 3),
+            "rows_per_second": round(size / wall_seconds, 3),
+            # ru_maxrss is in kilobytes on Linux
+            "peak_rss_mb": round(rusage.ru_maxrss / 1024, 1),
+            "output_bytes": output_bytes(workdir),
+            "returncode": process.returncode,
+        }
+
+
+def append_result(results_file_path: str, result: dict):
+    results_directory = os.path.dirname(results_file_path)
+    if results_directory != "":
+        os.makedirs(results_directory, exist_ok=True)
+    with open(results_file_path, "a") as results_file:
+        results_file.write(json.dumps(result, sort_keys=True) + "\n")
+
+
+def load_results(results_file_path: str, label: str):
+    try:
+        with open(results_file_path) as results_file:
+            return [result for result in map(json.loads, results_file) if result.get("label") == label]
+    except FileNotFoundError:
+        return []
+
+
+def result_key(result: dict):
+    return (result["case"], result["path"], result["rows"], result["jobs"], result["renderer"])
+
+
+def compare_results(baseline_results: list, results: list, max_regression: float):
+    # the latest baseline result for each case, path, size, jobs and renderer
+    baseline = {result_key(result): result for result in baseline_results}
+    if len(baseline) == 0:
+        print("No baseline results to compare against")
+        return True
+
+    passed = True
+    compared = 0
+    for result in results:
+        baseline_result = baseline.get(result_key(result))
+        if baseline_result is None or baseline_result["rows_per_second"] == 0:
+            continue
+        compared = compared + 1
+        change = result["rows_per_second"] / baseline_result["rows_per_second"] - 1
+        regressed = change < -max_regression
+        passed = passed and not regressed
+        print(f"{result['case']:20} {result['path']:6} {result['rows']:6} rows  {change * 100:+7.1f}% rows/s  "
+              f"{result['peak_rss_mb'] - baseline_result['peak_rss_mb']:+8.1f} MB peak{'  REGRESSION' if regressed else ''}")
+
+    if compared == 0:
+        print("No baseline results with the same case, path, size, jobs and renderer")
+    return passed
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+import functools
+import hashlib
+import json
+import os
+import tempfile
+
+# bump whenever a change to the renderers alters what ends up in a segment, it invalidates every manifest
+renderer_version = 2
+
+manifest_file_name = "manifest.json"
+
+
+@functools.lru_cache(maxsize=None)
+def file_digest(file_path: str):
+    # timing assets like silence.m4a are part of every row's fingerprint, hash them once per process
+    try:
+        with open(file_path, "rb") as asset:
+            return hashlib.sha256(asset.read()).hexdigest()
+    except FileNotFoundError:
+        return "missing"
+
+
+def row_fingerprint(*row_inputs):
+    # everything that affects a row's rendered segments goes in, the text, voices, fonts, timing assets and
+    # renderer version. Used as the row's name on disk, so it is kept short.
+    encoded_inputs = json.dumps(row_inputs, ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha256(encoded_inputs.encode("utf-8")).hexdigest()[:20]
+
+
+class BuildManifest:
+    # Maps each row fingerprint of a deck to the segment files rendered for it, so a rebuild only renders rows
+    # whose inputs changed and reuses everything else for the concat step.
+
+    def __init__(self, scratch_dir: str):
+        self.scratch_dir = scratch_dir
+        self.manifest_file_path = os.path.join(scratch_dir, manifest_file_name)
+        self.rows = {}
+
+        try:
+            with open(self.manifest_file_path, "r") as manifest_file:
+                manifest = json.load(manifest_file)
+            if manifest.get("renderer_version") == renderer_version:
+                self.rows = manifest.get("rows", {})
+        except FileNotFoundError:
+            pass
+        except (ValueError, AttributeError):
+            print(f"Ignoring unreadable build manifest {self.manifest_file_path}")
+
+    def is_current(self, fingerprint: str, segment_files: list):
+        if self.rows.get(fingerprint) != segment_files:
+            return False
+        return all(os.path.exists(os.path.join(self.scratch_dir, segment_file)) for segment_file in segment_files)
+
+    def record(self, fingerprint: str, segment_files: list):
+        self.rows[fingerprint] = segment_files
+
+    def record_rows(self, row_futures: list, segment_files_for_row):
+        # row_futures holds (fingerprint, future) pairs. Every row that rendered is recorded, even after one
+        # has failed, and the manifest is saved before the first error is raised, so the next build only
+        # renders the rows that failed.
+        first_error = None
+        for fingerprint, future in row_futures:
+            try:
+                future.result()
+            except Exception as e:
+                first_error = first_error or e
+                continue
+            self.record(fingerprint, segment_files_for_row(fingerprint))
+        self.save()
+        if first_error is not None:
+            raise first_error
+
+    def save(self, active_fingerprints: list = None):
+        if active_fingerprints is not None:
+            self.prune(set(active_fingerprints))
+
+        manifest = {"renderer_version": renderer_version, "rows": self.rows}
+        fd, temp_path = tempfile.mkstemp(dir=self.scratch_dir, suffix=".tmp")
+        with os.fdopen(fd, "w") as manifest_file:
+            json.dump(manifest, manifest_file, indent=1, sort_keys=True)
+        os.replace(temp_path, self.manifest_file_path)
+
+    def prune(self, active_fingerprints: set):
+        # drop rows that are no longer part of the deck, along with their segment files
+        active_segment_files = {segment_file for fingerprint in active_fingerprints for segment_file in self.rows.get(fingerprint, [])}
+        for fingerprint in list(self.rows):
+            if fingerprint in active_fingerprints:
+                continue
+            for segment_file in self.rows.pop(fingerprint):
+                if segment_file in active_segment_files:
+                    continue
+                try:
+                    os.remove(os.path.join(self.scratch_dir, segment_file))
+                except FileNotFoundError:
+                    pass
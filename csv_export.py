@@ -0,0 +1,88 @@
+import csv
+import gzip
+import io
+import os
+import uuid
+
+from stage_profiler import current_profiler, profiled, profiling_into, record_output
+
+export_formats = ["csv", "csv.gz", "parquet"]
+default_export_format = "csv"
+
+
+class CsvExport:
+    # Collects the projections of every input file (kana to english, kanji to kana, source to target) while the
+    # files are read and writes all of them in one pass at the end. Each file is written whole with writerows
+    # into a temp file next to it and renamed into place, so an importer never sees a half written export, and
+    # a file that fails is reported without stopping the others.
+
+    def __init__(self, export_format: str = default_export_format):
+        if export_format not in export_formats:
+            raise ValueError(f"unknown export format {export_format}")
+        self.export_format = export_format
+        self.projections = []
+
+    def add(self, output_file_path_without_extension: str, rows, column_names: tuple = None):
+        # rows is a PairView or any sequence of tuples, it is only read when the export is written. The stages
+        # are accounted to the profiler of the deck that added them.
+        if column_names is None:
+            column_names = (getattr(rows, "first_column", "first"), getattr(rows, "second_column", "second"))
+        self.projections.append((f"{output_file_path_without_extension}.{self.export_format}", rows, column_names, current_profiler()))
+
+    def write(self):
+        # returns whether every file was written
+        failed = []
+        created_directories = set()
+        for output_file_path, rows, column_names, profiler in self.projections:
+            try:
+                directory_path = os.path.dirname(output_file_path) or "."
+                if directory_path not in created_directories:
+                    os.makedirs(directory_path, exist_ok=True)
+                    created_directories.add(directory_path)
+
+                with profiling_into(profiler):
+                    write_export_file(output_file_path, rows, column_names, self.export_format)
+                print(f"Generated - {output_file_path}")
+            except Exception as e:
+                print(f"Failed to write {output_file_path}: {e}")
+                failed.append(output_file_path)
+
+        self.projections = []
+        if len(failed) > 0:
+            print(f"Failed to write {len(failed)} csv exports")
+        return len(failed) == 0
+
+
+@profiled("csv_export")
+def write_export_file(output_file_path: str, rows, column_names: tuple, export_format: str):
+    # a unique name rather than mkstemp, so the export gets the usual permissions of an output file
+    temp_path = os.path.join(os.path.dirname(output_file_path), f".{os.path.basename(output_file_path)}.{uuid.uuid4().hex}.tmp")
+    try:
+        if export_format == "parquet":
+            write_parquet(temp_path, rows, column_names)
+        elif export_format == "csv.gz":
+            # mtime=0 keeps the output byte identical between runs over the same input
+            with open(temp_path, "xb") as raw_file, gzip.GzipFile(fileobj=raw_file, mode="wb", mtime=0) as gzip_file:
+                with io.TextIOWrapper(gzip_file, encoding="utf-8", newline="") as out:
+                    csv.writer(out).writerows(rows)
+        else:
+            with open(temp_path, "x", encoding="utf-8", newline="") as out:
+                csv.writer(out).writerows(rows)
+        os.replace(temp_path, output_file_path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+    record_output("csv_export", output_file_path)
+
+
+def write_parquet(file_path: str, rows, column_names: tuple):
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        raise RuntimeError("pyarrow needs to be installed for the parquet export format")
+
+    columns = list(zip(*rows)) if len(rows) > 0 else [() for _ in column_names]
+    table = pyarrow.table({column_name: list(column) for column_name, column in zip(column_names, columns)})
+    pyarrow.parquet.write_table(table, file_path)
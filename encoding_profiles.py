@@ -0,0 +1,68 @@
+from collections import namedtuple
+
+# How the video paths encode a deck. Segments are muxed with ffmpeg's concat demuxer and -c copy, which
+# needs every segment of a deck to share codec, resolution, pixel format, fps and audio format, so all of
+# them are encoded with the one active profile and the profile is part of every row's fingerprint.
+EncodingProfile = namedtuple("EncodingProfile", ["preset", "crf", "tune", "fps", "keyframe_seconds", "audio_bitrate"])
+
+named_profiles = {
+    # a text card over speech, nothing moves between keyframes. A low frame rate and long gop leave the
+    # encoder very little to do, tune stillimage keeps the text edges sharp at a high crf.
+    "still": EncodingProfile(preset="veryfast", crf=28, tune="stillimage", fps=10, keyframe_seconds=10, audio_bitrate="96k"),
+    # closer to the encoder defaults, for cards that should look as crisp as possible
+    "quality": EncodingProfile(preset="medium", crf=20, tune="stillimage", fps=25, keyframe_seconds=2, audio_bitrate="160k"),
+    # what moviepy used before profiles existed
+    "moviepy": EncodingProfile(preset="medium", crf=None, tune=None, fps=25, keyframe_seconds=None, audio_bitrate=None),
+}
+
+default_encoding_profile = "still"
+
+# the profile segments are encoded with, set from the command line in the parent and in every render worker
+active_profile = named_profiles[default_encoding_profile]
+
+
+def configure_encoding(profile: EncodingProfile):
+    global active_profile
+    active_profile = profile
+
+
+def encoding_settings():
+    return (active_profile,)
+
+
+def active_encoding_profile():
+    return active_profile
+
+
+def encoding_profile_from_args(name: str, preset: str = None, crf: int = None, fps: int = None, audio_bitrate: str = None):
+    # a named profile with the options given on the command line overriding its fields
+    overrides = {"preset": preset, "crf": crf, "fps": fps, "audio_bitrate": audio_bitrate}
+    return named_profiles[name]._replace(**{field: value for field, value in overrides.items() if value is not None})
+
+
+def x264_params(profile: EncodingProfile):
+    # encoder options on top of the codec and preset, in ffmpeg's argument form
+    params = []
+    if profile.crf is not None:
+        params.extend(["-crf", str(profile.crf)])
+    if profile.tune is not None:
+        params.extend(["-tune", profile.tune])
+    if profile.keyframe_seconds is not None:
+        params.extend(["-g", str(max(1, int(profile.fps * profile.keyframe_seconds)))])
+    return params
+
+
+def moviepy_write_options(profile: EncodingProfile):
+    # keyword arguments for moviepy's write_videofile
+    return {
+        "fps": profile.fps,
+        "codec": "libx264",
+        "preset": profile.preset,
+        "audio_bitrate": profile.audio_bitrate,
+        "ffmpeg_params": x264_params(profile),
+    }
+
+
+def encoding_fingerprint():
+    # what the profile contributes to a row's fingerprint, changing it re-renders every row
+    return list(active_profile)
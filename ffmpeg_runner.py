@@ -0,0 +1,80 @@
+import os
+import subprocess
+import tempfile
+import uuid
+
+
+class FFmpegError(RuntimeError):
+    def __init__(self, command: list, return_code: int, log: str):
+        super().__init__(f"ffmpeg exited with {return_code}:\n{log}")
+        self.command = command
+        self.return_code = return_code
+        self.log = log
+
+
+def ffmpeg_exe():
+    import imageio_ffmpeg as ffmpeg
+
+    return ffmpeg.get_ffmpeg_exe()
+
+
+def run_ffmpeg(args: list, progress=None):
+    # Runs ffmpeg with an argument list, no shell involved. ffmpeg reports its progress on stdout through
+    # -progress, every block of key=value lines is handed to progress as a dict while it runs. Errors go to
+    # an anonymous temp file rather than a pipe, so a chatty ffmpeg can never block on a full stderr buffer.
+    # Returns the last progress block, raises FFmpegError with ffmpeg's log when it fails.
+    command = [ffmpeg_exe(), "-nostdin", "-hide_banner", "-loglevel", "error", "-nostats", "-progress", "pipe:1", *args]
+
+    last_progress = {}
+    with tempfile.TemporaryFile() as log:
+        process = subprocess.Popen(command, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=log, text=True)
+        block = {}
+        for line in process.stdout:
+            key, _, value = line.strip().partition("=")
+            block[key] = value
+            # every block ends with progress=continue, or progress=end once ffmpeg is done
+            if key == "progress":
+                last_progress = block
+                if progress is not None:
+                    progress(block)
+                block = {}
+        return_code = process.wait()
+
+        if return_code != 0:
+            log.seek(0)
+            raise FFmpegError(command, return_code, log.read().decode(errors="replace"))
+
+    return last_progress
+
+
+def concat_segments(segment_files: list, output_file_path: str, scratch_dir: str, progress=None):
+    # Joins encoded segments with the concat demuxer and -c copy. The list file is private to this call and
+    # ffmpeg writes to a temp file next to the output that is renamed into place, so concurrent muxes never
+    # share a file and a failed mux leaves the previous video untouched.
+    output_directory = os.path.dirname(output_file_path) or "."
+    os.makedirs(output_directory, exist_ok=True)
+
+    list_fd, list_file_path = tempfile.mkstemp(dir=scratch_dir, prefix="concat_", suffix=".txt")
+    # named rather than created with mkstemp, ffmpeg creates it with the usual permissions of an output file
+    temp_output_path = os.path.join(output_directory, f".{os.path.basename(output_file_path)}.{uuid.uuid4().hex}.tmp")
+    try:
+        with os.fdopen(list_fd, "w") as list_file:
+            for segment_file in segment_files:
+                # entries are resolved relative to the list file, quotes in a name are escaped the way the demuxer expects
+                escaped_segment_file = segment_file.replace("'", "'\\''")
+                list_file.write(f"file '{escaped_segment_file}'\n")
+
+        last_progress = run_ffmpeg(["-y", "-f", "concat", "-safe", "0", "-i", list_file_path, "-c", "copy", "-f", "mp4", temp_output_path], progress)
+        os.replace(temp_output_path, output_file_path)
+        return last_progress
+    finally:
+        os.remove(list_file_path)
+        if os.path.exists(temp_output_path):
+            os.remove(temp_output_path)
+
+
+def progress_printer(label: str):
+    # a progress callback printing how far ffmpeg got, one line per progress block
+    def print_progress(block: dict):
+        print(f"{label}: {block.get('out_time', '').split('.')[0]} written, {block.get('total_size', '0')} bytes, {block.get('progress')}")
+    return print_progress
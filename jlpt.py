@@ -1,20 +1,27 @@
 #!/opt/homebrew/bin/python3.10
 
-import csv
 import sys
-import wave
-import io
-import numpy as np
 import os
-import pydub as pd
-import imageio_ffmpeg as ffmpeg
 import argparse
-from moviepy.editor import *
-from PIL import Image, ImageDraw, ImageFont
-import cv2
-import subprocess
-
-import google.cloud.texttospeech as tts
+import shutil
+import functools
+
+# moviepy, numpy, PIL and the encoders are imported by the stages that use them, so csv only runs and
+# argument errors never pay for loading them
+from tts_cache import TTSCache, default_cache_dir, default_cache_size_mb
+from tts_engine import SynthesisEngine, synthesis_requests, default_max_workers, default_client_pool_size
+from tts_backends import SynthesisResponse, create_backend, backend_names, default_backend
+from render_jobs import deck_scratch_dir, row_scratch_dir, default_jobs
+from vocabulary_csv import VocabularyReader, PairView, japanese_schema
+from build_manifest import row_fingerprint, renderer_version
+from audio_assets import configure_assets, asset_fingerprint, silence_audio_clip, silence_samples
+from encoding_profiles import configure_encoding, encoding_profile_from_args, encoding_fingerprint, active_encoding_profile, moviepy_write_options, named_profiles, default_encoding_profile
+from ffmpeg_runner import concat_segments, progress_printer
+from audio_cleanup import configure_cleanup, cleanup_fingerprint, clean_speech, default_cleanup, cleanup_batch_rows
+from csv_export import CsvExport, export_formats, default_export_format
+from batch_scheduler import DeckBuild, print_batch_summary, report_fields
+from async_pipeline import create_batch_scheduler, pipeline_modes, default_pipeline_mode
+from stage_profiler import profiled, record_output, current_profiler, deck_profiler, profiling_into, write_deck_reports, start_cprofile, stop_cprofile, default_report_dir
 
 japanese_voice = "ja-JP-Standard-A"
 english_voice = "en-US-News-K"
@@ -22,27 +29,89 @@ english_voice = "en-US-News-K"
 japanese_language_code = "-".join(japanese_voice.split("-")[:2])
 english_language_code = "-".join(english_voice.split("-")[:2])
 
+card_font = "wqy-microhei.ttc"
+card_font_size = 80
+card_font_color = 'white'
+
+# shared text to speech engine, set up in main()
+synthesis_engine = None
+
+# pause between phrases in the audio only output, --pause-seconds
+default_pause_seconds = 5
+pause_duration_seconds = default_pause_seconds
+
 
 def main():
     # Create an ArgumentParser object
     parser = argparse.ArgumentParser(description="JLPT script.")
 
-    csv_data = ""  # Initialize the CSV data variable
-
     parser.add_argument('-d', '--debug', action='store_true', help='Verbose Mode')
     parser.add_argument('-f', '--file',  nargs='+', help='Input filename')
     parser.add_argument('-c', '--csv', action='store_true', help='Enable csv generation')
     parser.add_argument('-a', '--audio', action='store_true', help='Enable audio generation')
     parser.add_argument('-v', '--video', action='store_true', help='Enable audio generation')
 
+    parser.add_argument('--csv-format', choices=export_formats, default=default_export_format, help='Format of the csv exports, csv.gz compresses them and parquet (needs pyarrow) writes them column wise')
+
+    parser.add_argument('--encoding-profile', choices=list(named_profiles), default=default_encoding_profile, help='Video encoding settings, still is tuned for static text cards')
+    parser.add_argument('--preset', help='x264 preset, overrides the encoding profile')
+    parser.add_argument('--crf', type=int, help='x264 constant rate factor, overrides the encoding profile')
+    parser.add_argument('--fps', type=int, help='Video frame rate, overrides the encoding profile')
+    parser.add_argument('--audio-bitrate', help='Audio bitrate of the video paths, e.g. 96k, overrides the encoding profile')
+
+    parser.add_argument('--pause-seconds', type=float, default=default_pause_seconds, help='Pause between phrases in the audio only output')
+    parser.add_argument('--no-audio-cleanup', action='store_true', help='Keep the text to speech clips as they come back instead of trimming their silence and normalizing their loudness')
+    parser.add_argument('--trim-threshold-db', type=float, default=default_cleanup.threshold_db, help='Level in dBFS below which leading and trailing audio counts as silence')
+    parser.add_argument('--target-loudness-db', type=float, default=default_cleanup.target_db, help='Loudness in dBFS every voice is normalized to')
+
+    parser.add_argument('--silence-seconds', type=float, help='Generate the pause between phrases with this length instead of reading temp/silence.m4a')
+
+    parser.add_argument('--report-dir', default=default_report_dir, help='Directory for the per deck build reports (JSON and CSV stage timings)')
+    parser.add_argument('--profile', metavar='FILE', help='Write cProfile stats of the main process to FILE')
+
+    parser.add_argument('--tts-backend', choices=backend_names, default=default_backend, help='Text to speech backend, local and espeak work offline')
+    parser.add_argument('--tts-cache-dir', default=default_cache_dir, help='Directory for the text to speech cache')
+    parser.add_argument('--tts-cache-size', type=int, default=default_cache_size_mb, help='Text to speech cache size limit in MB')
+    parser.add_argument('--no-tts-cache', action='store_true', help='Disable the text to speech cache')
+    parser.add_argument('--tts-workers', type=int, default=default_max_workers, help='Number of concurrent text to speech requests')
+    parser.add_argument('--tts-clients', type=int, default=default_client_pool_size, help='Number of pooled text to speech clients')
+
+    parser.add_argument('-j', '--jobs', type=int, default=default_jobs, help='Number of worker processes rendering rows in parallel')
+    parser.add_argument('--pipeline', choices=pipeline_modes, default=default_pipeline_mode, help='Schedule the segment renderer deck by deck, or as asyncio stages with bounded queues between text to speech, rendering and muxing')
+    parser.add_argument('--renderer', choices=['segments', 'single-pass'], default='segments', help='Encode every segment separately and concat them, or stream the whole deck through one encoder')
+
     args = parser.parse_args()
 
+    cprofile = start_cprofile(args.profile)
+
+    configure_assets(args.silence_seconds)
+    configure_cleanup(default_cleanup._replace(enabled=not args.no_audio_cleanup, threshold_db=args.trim_threshold_db, target_db=args.target_loudness_db))
+
+    global pause_duration_seconds
+    pause_duration_seconds = args.pause_seconds
+    configure_encoding(encoding_profile_from_args(args.encoding_profile, args.preset, args.crf, args.fps, args.audio_bitrate))
+
+    # the text to speech backend and its cache are only set up when there is speech to synthesize, a csv
+    # only run never loads the backend's SDK or touches the cache directory
+    global synthesis_engine
+    if args.audio is True or args.video is True:
+        tts_cache = None
+        if args.no_tts_cache is False:
+            tts_cache = TTSCache(args.tts_cache_dir, args.tts_cache_size * 1024 * 1024)
+        synthesis_engine = SynthesisEngine(create_backend(args.tts_backend, args.tts_clients), tts_cache, args.tts_workers)
+
+    # video decks of all input files are rendered together as one batch once every file is read
+    batch = create_batch_scheduler(args.pipeline, synthesis_engine, args.jobs, args.tts_workers)
+    csv_export = CsvExport(args.csv_format)
+    # audio only and single pass outputs as (output_file_path, profiler, speech, generate), run once every
+    # file is read
+    outputs = []
+
     for input_filename in args.file:
         print("==============================================================================")
-        # Try to open and read the file
+        # Try to open the file and stream its kanji,kana,english rows
         try:
-            with open(input_filename, 'r') as file:
-                csv_data = file.read()
+            vocabulary = VocabularyReader(input_filename, japanese_schema)
         except FileNotFoundError:
             print(f"File '{input_filename}' not found.")
             sys.exit(1)
@@ -50,246 +119,271 @@ def main():
             print(f"An error occurred: {str(e)}")
             sys.exit(1)
 
-        # Split the CSV data into rows
-        rows = csv_data.strip().split('\n')
-
-        # Extract the kana to english data
-        kana_to_english_result_list = [row.split(',')[1:3] for row in rows]
-
-        # extract the kanji to kana data
-        kanji_to_kana_result_list = [row.split(',')[0:2] for row in rows]
-
-        if args.debug is True:
-            # Print the result list
-            for item in kana_to_english_result_list:
-                print(item)
-            for item in kanji_to_kana_result_list:
-                print(item)      
-
-        input_filename_without_extension = os.path.splitext(os.path.basename(input_filename))[0]
+        # everything done for this file is accounted to its deck in the build report
+        deck_name = os.path.splitext(os.path.basename(input_filename))[0]
+        with profiling_into(deck_profiler(deck_name)):
+            # the entries are held once, the kana to english and kanji to kana data are views onto them
+            with vocabulary:
+                entries = list(vocabulary)
+            kana_to_english_result_list = PairView(entries, "kana", "english")
+            kanji_to_kana_result_list = PairView(entries, "kanji", "kana")
+
+            if len(vocabulary.bad_rows) > 0:
+                print(f"Skipped {len(vocabulary.bad_rows)} bad rows in {input_filename}")
+
+            if args.debug is True:
+                # Print the result list
+                for item in kana_to_english_result_list:
+                    print(item)
+                for item in kanji_to_kana_result_list:
+                    print(item)      
+
+            input_filename_without_extension = os.path.splitext(os.path.basename(input_filename))[0]
+
+            if args.csv is True:
+                csv_export.add("kana_to_english_csv/" + input_filename_without_extension, kana_to_english_result_list)
+                csv_export.add("kanji_to_kana_csv/" + input_filename_without_extension, kanji_to_kana_result_list)
+
+            if args.audio is True:
+                speech = synthesis_requests(kana_to_english_result_list, japanese_voice, english_voice)
+                outputs.append((f"audio/{input_filename_without_extension}.mp4", current_profiler(), speech, functools.partial(generate_audio, kana_to_english_result_list, input_filename_without_extension)))
+
+            if args.video is True:
+                if args.renderer == "single-pass":
+                    speech = synthesis_requests(kana_to_english_result_list, japanese_voice, english_voice)
+                    outputs.append((f"video/{input_filename_without_extension}.mp4", current_profiler(), speech, functools.partial(generate_video_single_pass, entries, input_filename_without_extension)))
+                else:
+                    batch.add(plan_video(entries, input_filename_without_extension))    
+
+    # the csv exports of all input files are written together, a failed file doesn't stop the others
+    csv_succeeded = csv_export.write()
+
+    # the speech of every output of every file is planned before any of it is synthesized, so a phrase
+    # shared by several decks or outputs is synthesized once
+    if synthesis_engine is not None:
+        speech = [request for _, _, output_speech, _ in outputs for request in output_speech] + batch.speech()
+        synthesis_engine.plan(speech)
+        print(f"Planned {len(speech)} text to speech requests for {len(outputs)} outputs and {len(batch.decks)} decks, {len(set(speech))} distinct")
+
+    # an output that fails is reported without stopping the others or the batch
+    failed_outputs = []
+    for output_file_path, profiler, _, generate in outputs:
+        try:
+            with profiling_into(profiler):
+                generate()
+        except Exception as e:
+            print(f"Failed to generate {output_file_path}: {e}")
+            failed_outputs.append(output_file_path)
+    if len(failed_outputs) > 0:
+        print(f"Failed to generate {len(failed_outputs)} audio and single pass outputs")
 
-        if args.csv is True:
-            generate_output_csv("kana_to_english_csv/" + input_filename_without_extension, kana_to_english_result_list)
-            generate_output_csv("kanji_to_kana_csv/" + input_filename_without_extension, kanji_to_kana_result_list)
+    batch_reports = batch.run(plan=False)
+    batch_succeeded = print_batch_summary(batch_reports) if len(batch_reports) > 0 else True
 
-        if args.audio is True:
-            generate_audio(kana_to_english_result_list, input_filename_without_extension)    
+    if synthesis_engine is not None:
+        synthesis_engine.close()
 
-        if args.video is True:
-            generate_video(kana_to_english_result_list, kanji_to_kana_result_list, input_filename_without_extension)    
+    write_deck_reports(args.report_dir, {report.name: report_fields(report) for report in batch_reports})
+    stop_cprofile(cprofile, args.profile)
 
-def text_to_wav(text: str, language_code: str, voice_name: str):
-    audio_config = tts.AudioConfig(audio_encoding=tts.AudioEncoding.LINEAR16)
-    text_input = tts.SynthesisInput(text=text)
-    voice_params = tts.VoiceSelectionParams(
-        language_code=language_code, name=voice_name
-    )
-    client = tts.TextToSpeechClient()
-    response = client.synthesize_speech(
-        input=text_input,
-        voice=voice_params,
-        audio_config=audio_config,
-    )
-    return response
-
-
-def generate_output_csv(output_file_path: str, result_list: list):
-
-    # Extract the directory path from the file path
-    directory_path = os.path.dirname(output_file_path)
-
-    # Check if the directory exists, and create it if it doesn't
-    if not os.path.exists(directory_path):
-        os.makedirs(directory_path)
-
-    # Write the result list to a CSV file
-    try:
-        with open(output_file_path + ".csv", 'w', newline='') as csvfile:
-            csvwriter = csv.writer(csvfile)
-            for item in result_list:
-                csvwriter.writerow(item)
-        print(f"Generated - {output_file_path}.csv")
-    except Exception as e:
-        print(f"An error occurred: {str(e)}")
+    if not (csv_succeeded and len(failed_outputs) == 0 and batch_succeeded):
         sys.exit(1)
 
+@profiled("text_to_wav")
+def text_to_wav(text: str, language_code: str, voice_name: str):
+    audio_content = synthesis_engine.synthesize(text, language_code, voice_name)
+    return SynthesisResponse(audio_content)
 
-def generate_image(text: str):
-    # Create a blank image with a white background
-    width, height = 800, 600  # Adjust the dimensions as needed
-    background_color = (255, 255, 255)  # White
-    image = Image.new("RGB", (width, height), background_color)
 
-    # Create a drawing context
-    draw = ImageDraw.Draw(image)
+def video_segment_files(row_key):
+    return [f"output_{row_key}.mp4"]
 
-    # Choose a font and font size
-    font_path = "path/to/your/font.ttf"  # Specify the path to your font file
-    font_size = 36
-   # font = ImageFont.truetype(font_path, font_size)
+def segment_list(row_keys):
+    # the segments of every row in deck order, as concat_segments() joins them
+    return [segment_file for row_key in row_keys for segment_file in video_segment_files(row_key)]
 
-    # Choose text color
-    text_color = (0, 0, 0)  # Black
 
-    # Calculate the position to center the text
-    text_width, text_height = draw.textsize(text)
-    x = (width - text_width) / 2
-    y = (height - text_height) / 2
+def generate_word_and_translation_audio_parts(jap_text: str, english_text: str):
+    japanese_audio = text_to_wav(jap_text, japanese_language_code, japanese_voice)
+    english_audio = text_to_wav(english_text, english_language_code, english_voice)  
 
-    # Write the text on the image
-    draw.text((x, y), text, fill=text_color, align="center")
+    return sequenced_audio_parts(japanese_audio.audio_content, english_audio.audio_content)
 
-    # Save the image
-    output_filename = "text_image.png"  # Specify the output filename
-    image.save(output_filename)
+@profiled("load_clip", child_processes=True)
+def sequenced_audio_parts(japanese_audio_content: bytes, english_audio_content: bytes):
+    from audio_timeline import samples_from_contents
 
-def generate_input_file_to_ffmpeg(list_length):
-    with open("temp/ffmpeg_list", "wb") as out: 
-        for index in range(list_length):
-            out.write(f"file 'output_{index}.mp4'\n".encode())
+    # the japanese and english audio with the gaps between them, as parts of a card on an AudioTimeline
+    # Load the two audio clips, decoded straight from the response bytes, trimmed and normalized together
+    jap_audio, english_audio = samples_from_contents([japanese_audio_content, english_audio_content])
+    silence_audio = silence_samples()
 
+    return [jap_audio, silence_audio, english_audio, silence_audio]
 
-def generate_word_and_translation_sequenced_audio_clip(jap_text: str, english_text: str):
-    japanese_audio = text_to_wav(jap_text, japanese_language_code, japanese_voice)
-    english_audio = text_to_wav(english_text, english_language_code, english_voice)  
+def generate_sequenced_audio_clip(japanese_audio_content: bytes, english_audio_content: bytes):
+    from audio_timeline import AudioTimeline
 
-    with open("temp/temp_jap.wav", "wb") as out:
-        out.write(japanese_audio.audio_content)
-        out.close()
-    with open("temp/temp_english.wav", "wb") as out:
-        out.write(english_audio.audio_content)
+    # combine the japanese and english audio into a single clip which has the image showing in it as video
+    timeline = AudioTimeline()
+    timeline.add_card(None, *sequenced_audio_parts(japanese_audio_content, english_audio_content))
+    return timeline.audio_clip()
 
-    # open the temp jap file and temp english audio files and combine the two audio files into a single mp4 file which has
-    # the image showing in it as video
-    # Load the two audio files
-    jap_audio = AudioFileClip("temp/temp_jap.wav")
-    english_audio = AudioFileClip("temp/temp_english.wav")
-    silence_audio = AudioFileClip("temp/silence.m4a")
+def rasterize_text_card(word_text):
+    from text_cards import render_text_card
 
-    # Concatenate the audio clips with the gap
-    return concatenate_audioclips([jap_audio, silence_audio, english_audio, silence_audio])
+    return render_text_card(word_text, card_font, card_font_size, card_font_color)
 
+@profiled("text_clip")
 def generate_text_clip(word_text, duration):
-    font_size = 50
-    font_color = 'white'
-    position = 'center' 
-    font = "wqy-microhei.ttc"
+    from moviepy.video.VideoClip import ImageClip
+
+    # the card is rasterized once per distinct text and held as a still frame for the whole duration
+    kanji_txt_clip = ImageClip(rasterize_text_card(word_text))
+    kanji_txt_clip = kanji_txt_clip.set_duration(duration)
 
-    # kanji_txt_clip = TextClip(word_text, fontsize=font_size, color=font_color, font=font)
-    kanji_txt_clip = TextClip(word_text, size=(0, 100), color=font_color, font=font)
-    kanji_txt_clip = kanji_txt_clip.set_position(position).set_duration(duration)
-    #if len(word_text) == 1:
-    #    kanji_txt_clip = kanji_txt_clip.set_start(20)
     return kanji_txt_clip
 
 
 def generate_empty_text_clip():
+    from moviepy.video.VideoClip import ImageClip
+    from text_cards import render_text_card
+
     font_size = 50
     font_color = 'white'
-    position = 'center' 
     font = "wqy-microhei.ttc"
 
-    empty_txt_clip = TextClip("~", fontsize=font_size, color=font_color, font=font)
-    silence_audio = AudioFileClip("temp/silence.m4a")
-    empty_txt_clip = empty_txt_clip.set_position(position).set_duration(silence_audio.duration)
+    silence_audio = silence_audio_clip()
+    empty_txt_clip = ImageClip(render_text_card("~", font, font_size, font_color))
+    empty_txt_clip = empty_txt_clip.set_duration(silence_audio.duration)
     return empty_txt_clip
 
-def run_ffmpeg_command(ouput_file_name_without_extension):
+def segment_render_settings():
+    from video_renderer import default_canvas_size
+
+    # everything apart from the row's own text and voices that ends up in a rendered segment
+    return [
+        renderer_version,
+        synthesis_engine.backend.name,
+        card_font, card_font_size, card_font_color, default_canvas_size,
+        *asset_fingerprint(),
+        *encoding_fingerprint(),
+        *cleanup_fingerprint(),
+    ]
+
+@profiled("write_segment", child_processes=True)
+def write_segment(video_clip, segment_file_path: str, row_dir: str):
+    # keep moviepy's temporary audio file inside the row's scratch directory, by default it lands in the
+    # working directory under a name derived from the segment and would collide between decks
+    temp_audiofile = os.path.join(row_dir, os.path.splitext(os.path.basename(segment_file_path))[0] + "_audio.mp3")
+    video_clip.write_videofile(segment_file_path, temp_audiofile=temp_audiofile, **moviepy_write_options(active_encoding_profile()))
+    record_output("write_segment", segment_file_path)
+
+@profiled("concat", child_processes=True)
+def run_ffmpeg_command(ouput_file_name_without_extension, segment_files, scratch_dir="temp"):
 
     file_path = f"video/{ouput_file_name_without_extension}.mp4"
-    if os.path.exists(file_path):
-        os.remove(file_path)
-        print(f"File {file_path} has been removed.")
 
-    command = f'ffmpeg -f concat -safe 0 -i temp/ffmpeg_list -c copy {file_path}'
-    # Run the command in a subprocess
-    try:
-        result = subprocess.run(command, shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, check=True)
-        # Print the standard output of the command
-        print("Command output:")
-        print(result.stdout)
-    
-    except subprocess.CalledProcessError as e:
-        # If the command returns a non-zero exit code, it will raise a CalledProcessError
-        print("Error running the command:")
-        print(e)
+    # the previous video is only replaced once the new one is complete, a failed mux raises and fails the deck
+    concat_segments(segment_files, file_path, scratch_dir, progress_printer(f"Muxing {file_path}"))
+    record_output("concat", file_path)
+    print(f"Generated - {file_path} from {len(segment_files)} segments")
 
-def generate_video(kana_to_english_result_list: list, kanji_to_kana_result_list: list, ouput_file_name_without_extension: str): 
-    ix = 0
+def render_video_row(row_key: str, kanji_text: str, japanese_audio_content: bytes, english_audio_content: bytes, scratch_dir: str):
+    row_dir = row_scratch_dir(scratch_dir, row_key)
 
-    for item in kana_to_english_result_list:
+    sequenced_audio = generate_sequenced_audio_clip(japanese_audio_content, english_audio_content)
+    kanji_txt_clip = generate_text_clip(kanji_text, sequenced_audio.duration)
 
-        sequenced_audio = generate_word_and_translation_sequenced_audio_clip(item[0], item[1])
-        kanji_text = kanji_to_kana_result_list[ix][0]
-        kanji_txt_clip = generate_text_clip(kanji_text, sequenced_audio.duration)
+    # Attach the audio to the still text card
+    combined_video = kanji_txt_clip.set_audio(sequenced_audio)
+    write_segment(combined_video, f"{scratch_dir}/output_{row_key}.mp4", row_dir)
 
-        # Combine the text and audio clips into a single video track
-        combined_video = CompositeVideoClip([kanji_txt_clip.set_audio(sequenced_audio)])
-        combined_video.write_videofile(f"temp/output_{ix}.mp4", fps=25)    
+    shutil.rmtree(row_dir, ignore_errors=True)
+    print(f"Done with video for {kanji_text}")
 
-        print(f"Done with video for {kanji_text}")
+def plan_video(entries: list, ouput_file_name_without_extension: str):
+    deck = DeckBuild(ouput_file_name_without_extension, video_segment_files, segment_list, run_ffmpeg_command)
 
-        ix = ix + 1    
+    # fingerprint every row, only rows whose inputs changed since the last build are rendered again
+    for entry in entries:
+        row_key = row_fingerprint("kanji", (entry.kanji, entry.kana, entry.english), japanese_voice, english_voice, segment_render_settings())
 
-    generate_input_file_to_ffmpeg(len(kana_to_english_result_list))
-    run_ffmpeg_command(ouput_file_name_without_extension)
+        speech = [(entry.kana, japanese_language_code, japanese_voice), (entry.english, english_language_code, english_voice)]
+        deck.add_row(row_key, speech, functools.partial(render_video_row, row_key, entry.kanji))
 
+    return deck
 
-def generate_audio(kana_to_english_result_list: list,ouput_file_name_without_extension: str): 
 
-    pause_duration_seconds = 5
+@profiled("single_pass_render", child_processes=True)
+def generate_video_single_pass(entries: list, ouput_file_name_without_extension: str):
+    scratch_dir = deck_scratch_dir(ouput_file_name_without_extension)
+
+    # the deck was planned with the rest of the run, synthesis runs a window of rows ahead of the loop below
+    requests = synthesis_requests(PairView(entries, "kana", "english"), japanese_voice, english_voice)
+
+    from audio_timeline import AudioTimeline
+    from video_renderer import SinglePassRenderer
+
+    renderer = SinglePassRenderer(f"video/{ouput_file_name_without_extension}.mp4", f"{scratch_dir}/single_pass", profile=active_encoding_profile())
+
+    for index, entry in enumerate(entries):
+        synthesis_engine.prefetch_window(requests, 2 * index)
+
+        timeline = AudioTimeline()
+        timeline.add_card(entry.kanji, *generate_word_and_translation_audio_parts(entry.kana, entry.english))
+        renderer.add_timeline(timeline)
+
+        print(f"Done with audio for {entry.kanji}")
+
+    renderer.render(rasterize_text_card)
+    record_output("single_pass_render", renderer.output_file_path)
+
+
+@profiled("generate_audio", child_processes=True)
+def generate_audio(kana_to_english_result_list: list,ouput_file_name_without_extension: str): 
 
     print(f"Generating audio for {ouput_file_name_without_extension}")
-    combined_audio = wave.open(f"wav/{ouput_file_name_without_extension}.wav", 'wb')
-    combined_audio_params_set = False
-
-    ix = 0
-    for item in kana_to_english_result_list:
-        japanese_audio = text_to_wav(item[0], japanese_language_code, japanese_voice)
-        english_audio = text_to_wav(item[1], english_language_code, english_voice)  
-
-        with open("temp_jap", "wb") as out:
-            out.write(japanese_audio.audio_content)
-            out.close()
-        with open("temp_english", "wb") as out:
-            out.write(english_audio.audio_content)
-            out.close()
-
-        japanese_audio_wav = wave.open("temp_jap", 'rb')
-        english_audio_wav = wave.open("temp_english", 'rb')
-
-        japanese_audio_data = japanese_audio_wav.readframes(1000024)
-        english_audio_data = english_audio_wav.readframes(1000024)    
-
-        reference_params = japanese_audio_wav.getparams()
-
-        pause_frames = int(reference_params.framerate * pause_duration_seconds)    
-        zero_frames = np.zeros(reference_params.nchannels * reference_params.sampwidth * pause_frames, dtype=np.uint8)
-
-        if combined_audio_params_set == False:
-            combined_audio.setparams(reference_params)                  # Set the parameters for the output WAV file
-            combined_audio_params_set = True
-            combined_audio.writeframes(zero_frames.tobytes())   # add 5 seconds of silence
-        combined_audio.writeframes(japanese_audio_data)     # write the japanese audio
-        combined_audio.writeframes(zero_frames.tobytes())   # add 5 seconds of silence
-        combined_audio.writeframes(english_audio_data)      # write the english audio 
-        combined_audio.writeframes(zero_frames.tobytes())   # add 5 seconds of silence
-
-        japanese_audio_wav.close()
-        japanese_audio_wav.close()
-        print(f"finished writing {item[0]}:{item[1]}")
-        ix = ix + 1
-
-    combined_audio.close()    
-
-    # remove the temp_jap and temp_english files
-    os.remove("temp_jap")
-    os.remove("temp_english")
-
-    # convert wav file to mp4
-    sound = pd.AudioSegment.from_wav(f"wav/{ouput_file_name_without_extension}.wav")
-    sound.export(f"audio/{ouput_file_name_without_extension}.mp4", format="mp4")
-    print(f"finished generating mp4 file - mp4/{ouput_file_name_without_extension}.mp4")
+
+    from audio_assembler import StreamingAudioEncoder
+
+    # the pcm is piped straight into the encoder, there is no intermediate wav file
+    combined_audio = StreamingAudioEncoder(f"audio/{ouput_file_name_without_extension}.mp4")
+
+    # the deck was planned with the rest of the run, synthesis runs up to a batch of rows ahead of the batch
+    # being encoded
+    requests = synthesis_requests(kana_to_english_result_list, japanese_voice, english_voice)
+
+    # the encoder is stopped and its temp file dropped if the deck fails part way, the previous file stays
+    try:
+        combined_audio.write_silence(pause_duration_seconds)        # add the pause
+
+        # the clips are trimmed and normalized a batch of rows at a time
+        for batch_start in range(0, len(kana_to_english_result_list), cleanup_batch_rows):
+            rows = kana_to_english_result_list[batch_start:batch_start + cleanup_batch_rows]
+            synthesis_engine.prefetch_window(requests, 2 * batch_start)
+
+            audio_contents = []
+            for item in rows:
+                audio_contents.append(text_to_wav(item[0], japanese_language_code, japanese_voice).audio_content)
+                audio_contents.append(text_to_wav(item[1], english_language_code, english_voice).audio_content)
+            clips = clean_speech(audio_contents)
+
+            for row_index, item in enumerate(rows):
+                japanese_samples, japanese_sample_rate = clips[2 * row_index]
+                english_samples, english_sample_rate = clips[2 * row_index + 1]
+
+                combined_audio.write_samples(japanese_samples, japanese_sample_rate)      # write the japanese audio
+                combined_audio.write_silence(pause_duration_seconds)        # add the pause
+                combined_audio.write_samples(english_samples, english_sample_rate)      # write the english audio
+                combined_audio.write_silence(pause_duration_seconds)        # add the pause
+
+                print(f"finished writing {item[0]}:{item[1]}")
+
+        combined_audio.close()
+    finally:
+        combined_audio.abort()
+    record_output("generate_audio", f"audio/{ouput_file_name_without_extension}.mp4")
+    print(f"finished generating mp4 file - audio/{ouput_file_name_without_extension}.mp4")
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
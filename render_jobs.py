@@ -0,0 +1,66 @@
+import concurrent.futures
+import multiprocessing
+import os
+
+from audio_assets import configure_assets, asset_settings
+from encoding_profiles import configure_encoding, encoding_settings
+from audio_cleanup import configure_cleanup, cleanup_settings
+
+default_jobs = 1
+scratch_root = "temp"
+
+
+class InlineExecutor:
+    # Same interface as a ProcessPoolExecutor but runs every task right away in this process,
+    # so --jobs 1 goes through exactly the same code path as the parallel mode.
+
+    def submit(self, fn, *args, **kwargs):
+        future = concurrent.futures.Future()
+        try:
+            future.set_result(fn(*args, **kwargs))
+        except BaseException as e:
+            future.set_exception(e)
+        return future
+
+    def shutdown(self, wait=True, cancel_futures=False):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.shutdown()
+        return False
+
+
+def create_row_executor(jobs: int):
+    if jobs is None or jobs <= 1:
+        return InlineExecutor()
+    # spawn rather than fork, the parent already runs text to speech threads. Workers start from a fresh
+    # interpreter, so they are handed the asset, encoding and audio cleanup settings chosen on the command line.
+    return concurrent.futures.ProcessPoolExecutor(
+        max_workers=jobs,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=configure_worker,
+        initargs=(asset_settings(), encoding_settings(), cleanup_settings())
+    )
+
+
+def configure_worker(asset_settings: tuple, encoding_settings: tuple, cleanup_settings: tuple):
+    configure_assets(*asset_settings)
+    configure_encoding(*encoding_settings)
+    configure_cleanup(*cleanup_settings)
+
+
+def deck_scratch_dir(deck_name: str):
+    # every deck renders into its own directory under temp/ so concurrent builds never share files
+    scratch_dir = os.path.join(scratch_root, deck_name)
+    os.makedirs(scratch_dir, exist_ok=True)
+    return scratch_dir
+
+
+def row_scratch_dir(scratch_dir: str, row_key: str):
+    row_dir = os.path.join(scratch_dir, f"row_{row_key}")
+    os.makedirs(row_dir, exist_ok=True)
+    return row_dir
+
@@ -0,0 +1,185 @@
+import contextlib
+import cProfile
+import csv
+import functools
+import json
+import os
+import threading
+import time
+
+try:
+    import resource
+except ImportError:
+    # not available on windows, child process CPU is reported as 0 there
+    resource = None
+
+default_report_dir = "reports"
+
+stage_fields = ["calls", "wall_seconds", "cpu_seconds", "child_cpu_seconds", "bytes_written"]
+
+
+class StageProfiler:
+    # Accumulates calls, wall time, CPU time of the calling thread and bytes written per pipeline stage.
+    # Stages that run ffmpeg also get the CPU time of the child processes that finished while they ran, the
+    # encoding itself happens there. Thread safe, and a snapshot can be merged into another profiler, e.g.
+    # the stages a render worker process measured for one row into the profile of the row's deck.
+
+    def __init__(self):
+        self.stages = {}
+        self.lock = threading.Lock()
+
+    def add(
+            self,
+            stage_name: str,
+            calls: int = 0,
+            wall_seconds: float = 0,
+            cpu_seconds: float = 0,
+            child_cpu_seconds: float = 0,
+            bytes_written: int = 0
+    ):
+        with self.lock:
+            stage = self.stages.setdefault(stage_name, dict.fromkeys(stage_fields, 0))
+            stage["calls"] = stage["calls"] + calls
+            stage["wall_seconds"] = stage["wall_seconds"] + wall_seconds
+            stage["cpu_seconds"] = stage["cpu_seconds"] + cpu_seconds
+            stage["child_cpu_seconds"] = stage["child_cpu_seconds"] + child_cpu_seconds
+            stage["bytes_written"] = stage["bytes_written"] + bytes_written
+
+    @contextlib.contextmanager
+    def stage(self, stage_name: str, child_processes: bool = False):
+        # child_processes for stages that run ffmpeg. The children's CPU is counted per process, so stages
+        # running ffmpeg on several threads of one process at the same time can see each other's.
+        wall_start = time.perf_counter()
+        cpu_start = time.thread_time()
+        child_cpu_start = children_cpu_time() if child_processes else 0
+        try:
+            yield
+        finally:
+            child_cpu_seconds = children_cpu_time() - child_cpu_start if child_processes else 0
+            self.add(stage_name, 1, time.perf_counter() - wall_start, time.thread_time() - cpu_start, child_cpu_seconds)
+
+    def snapshot(self):
+        with self.lock:
+            return {stage_name: dict(stage) for stage_name, stage in self.stages.items()}
+
+    def merge(self, snapshot: dict):
+        for stage_name, stage in snapshot.items():
+            self.add(stage_name, **stage)
+
+
+# stages are recorded into the profiler of the deck being worked on, falling back to one for the whole process
+process_profiler = StageProfiler()
+deck_profilers = {}
+deck_profilers_lock = threading.Lock()
+local_state = threading.local()
+
+
+def children_cpu_time():
+    # user and system time of every child process this process has waited for so far
+    if resource is None:
+        return 0
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+
+def current_profiler():
+    return getattr(local_state, "profiler", None) or process_profiler
+
+
+def deck_profiler(deck_name: str):
+    with deck_profilers_lock:
+        return deck_profilers.setdefault(deck_name, StageProfiler())
+
+
+@contextlib.contextmanager
+def profiling_into(profiler: StageProfiler):
+    # stages recorded by this thread inside the block go to profiler
+    previous_profiler = getattr(local_state, "profiler", None)
+    local_state.profiler = profiler
+    try:
+        yield profiler
+    finally:
+        local_state.profiler = previous_profiler
+
+
+def profiled(stage_name: str, child_processes: bool = False):
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with current_profiler().stage(stage_name, child_processes):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def record_output(stage_name: str, file_path: str):
+    # bytes a stage wrote, counted from the finished file
+    try:
+        current_profiler().add(stage_name, bytes_written=os.path.getsize(file_path))
+    except OSError:
+        pass
+
+
+def call_with_profiler(profiler: StageProfiler, fn, *args):
+    with profiling_into(profiler):
+        return fn(*args)
+
+
+def run_profiled(fn, *args):
+    # Runs fn with a fresh profiler and returns what it measured, picklable so it can come back from a worker
+    # process. Whatever fn returns is dropped.
+    profiler = StageProfiler()
+    call_with_profiler(profiler, fn, *args)
+    return profiler.snapshot()
+
+
+def write_deck_report(deck_name: str, profiler: StageProfiler, report_dir: str = default_report_dir, extra: dict = None):
+    stages = profiler.snapshot()
+    os.makedirs(report_dir, exist_ok=True)
+
+    report = {"deck": deck_name, "stages": stages}
+    report.update(extra or {})
+    with open(os.path.join(report_dir, f"{deck_name}.json"), "w") as report_file:
+        json.dump(report, report_file, indent=2, sort_keys=True)
+
+    with open(os.path.join(report_dir, f"{deck_name}.csv"), "w", newline="") as report_file:
+        writer = csv.writer(report_file)
+        writer.writerow(["stage"] + stage_fields)
+        for stage_name in sorted(stages):
+            stage = stages[stage_name]
+            writer.writerow([
+                stage_name,
+                stage["calls"],
+                f"{stage['wall_seconds']:.3f}",
+                f"{stage['cpu_seconds']:.3f}",
+                f"{stage['child_cpu_seconds']:.3f}",
+                stage["bytes_written"],
+            ])
+
+    print(f"Wrote build report {report_dir}/{deck_name}.json")
+
+
+def write_deck_reports(report_dir: str = default_report_dir, deck_results: dict = None):
+    # one report per deck touched in this process, deck_results adds e.g. the batch outcome of a deck
+    deck_results = deck_results or {}
+    with deck_profilers_lock:
+        profilers = dict(deck_profilers)
+    for deck_name, profiler in profilers.items():
+        write_deck_report(deck_name, profiler, report_dir, deck_results.get(deck_name))
+
+
+def start_cprofile(profile_file_path: str):
+    if profile_file_path is None:
+        return None
+    profile = cProfile.Profile()
+    profile.enable()
+    return profile
+
+
+def stop_cprofile(profile, profile_file_path: str):
+    # covers the main process only, render workers are measured by the stage reports
+    if profile is None:
+        return
+    profile.disable()
+    profile.dump_stats(profile_file_path)
+    print(f"Wrote cProfile stats to {profile_file_path}")
@@ -0,0 +1,59 @@
+import functools
+
+import numpy as np
+from PIL import Image, ImageDraw, ImageFont
+
+from video_renderer import default_canvas_size
+
+default_font = "wqy-microhei.ttc"
+default_font_size = 80
+default_font_color = "white"
+default_background_color = "black"
+
+# every card is a full canvas frame (2.7MB at 1280x720), and decks mostly show the same card a few times
+# in a row, so a small cache covers the reuse without holding on to a lot of memory
+card_cache_size = 32
+
+# keep text clear of the canvas edges
+max_text_width_ratio = 0.95
+
+
+@functools.lru_cache(maxsize=None)
+def load_font(font: str, font_size: int):
+    try:
+        return ImageFont.truetype(font, font_size)
+    except OSError:
+        print(f"Font {font} not found, falling back to the default font")
+        return ImageFont.load_default(font_size)
+
+
+@functools.lru_cache(maxsize=card_cache_size)
+def render_text_card(
+        text: str,
+        font: str = default_font,
+        font_size: int = default_font_size,
+        font_color: str = default_font_color,
+        canvas_size: tuple = default_canvas_size
+):
+    # Rasterizes the text centered on a canvas sized frame. The frame is cached and shared between callers,
+    # so it is handed out read only.
+    image = Image.new("RGB", canvas_size, default_background_color)
+
+    if text.strip() != "":
+        draw = ImageDraw.Draw(image)
+        card_font = load_font(font, font_size)
+        left, top, right, bottom = draw.textbbox((0, 0), text, font=card_font)
+
+        # shrink long glosses until they fit across the canvas
+        max_text_width = canvas_size[0] * max_text_width_ratio
+        if right - left > max_text_width:
+            card_font = load_font(font, max(8, int(font_size * max_text_width / (right - left))))
+            left, top, right, bottom = draw.textbbox((0, 0), text, font=card_font)
+
+        x = (canvas_size[0] - (right - left)) / 2 - left
+        y = (canvas_size[1] - (bottom - top)) / 2 - top
+        draw.text((x, y), text, font=card_font, fill=font_color)
+
+    frame = np.array(image)
+    frame.flags.writeable = False
+    return frame
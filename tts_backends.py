@@ -0,0 +1,155 @@
+import collections
+import hashlib
+import io
+import shutil
+import subprocess
+import threading
+import wave
+
+default_backend = "google"
+
+# what text_to_wav hands back, mirrors the audio_content field of the google SynthesizeSpeechResponse
+SynthesisResponse = collections.namedtuple("SynthesisResponse", ["audio_content"])
+
+
+class TTSBackend:
+    # Turns a phrase into LINEAR16 WAV bytes (header included). cacheable tells the engine whether results
+    # are worth keeping in the on-disk cache.
+    name = None
+    cacheable = False
+
+    def synthesize(self, text: str, language_code: str, voice_name: str):
+        raise NotImplementedError
+
+    def retryable_errors(self):
+        return ()
+
+
+class GoogleTTSBackend(TTSBackend):
+    # Google Cloud text to speech. The clients are thread safe, so the workers share them round robin
+    # instead of checking them out.
+    name = "google"
+    cacheable = True
+
+    def __init__(self, client_pool_size: int = 2):
+        import google.cloud.texttospeech as tts
+
+        self.tts = tts
+        self.client_pool_size = max(1, client_pool_size)
+        self.clients = []
+        self.client_index = 0
+        self.clients_lock = threading.Lock()
+
+    def synthesize(self, text: str, language_code: str, voice_name: str):
+        tts = self.tts
+        audio_config = tts.AudioConfig(audio_encoding=tts.AudioEncoding.LINEAR16)
+        text_input = tts.SynthesisInput(text=text)
+        voice_params = tts.VoiceSelectionParams(
+            language_code=language_code, name=voice_name
+        )
+        response = self._client().synthesize_speech(
+            input=text_input,
+            voice=voice_params,
+            audio_config=audio_config,
+        )
+        return response.audio_content
+
+    def retryable_errors(self):
+        from google.api_core import exceptions as google_exceptions
+
+        return (
+            google_exceptions.ResourceExhausted,
+            google_exceptions.ServiceUnavailable,
+            google_exceptions.DeadlineExceeded,
+        )
+
+    def _client(self):
+        with self.clients_lock:
+            if len(self.clients) < self.client_pool_size:
+                self.clients.append(self.tts.TextToSpeechClient())
+                return self.clients[-1]
+
+            client = self.clients[self.client_index % len(self.clients)]
+            self.client_index = self.client_index + 1
+            return client
+
+
+class LocalTTSBackend(TTSBackend):
+    # Offline stand-in that needs no network or credentials. Every phrase becomes a short tone with a bit of
+    # noise, seeded from the request so the same phrase always produces the same bytes. The duration roughly
+    # follows how long a speaker would take to read the phrase.
+    name = "local"
+
+    sample_rate = 24000
+    base_duration_seconds = 0.4
+    seconds_per_character = 0.08
+    seconds_per_wide_character = 0.18   # kana and kanji take longer to read than a latin letter
+
+    def synthesize(self, text: str, language_code: str, voice_name: str):
+        import numpy as np
+
+        seed = int.from_bytes(hashlib.sha256(f"{voice_name}\0{text}".encode("utf-8")).digest()[:8], "little")
+        rng = np.random.default_rng(seed)
+
+        duration = self.phrase_duration(text)
+        sample_count = int(self.sample_rate * duration)
+        t = np.arange(sample_count) / self.sample_rate
+
+        frequency = 180 + seed % 220
+        tone = np.sin(2 * np.pi * frequency * t) + 0.1 * rng.standard_normal(sample_count)
+
+        # fade in and out so the clips don't click when they are butted up against each other
+        fade_count = min(sample_count // 2, int(self.sample_rate * 0.02))
+        envelope = np.ones(sample_count)
+        envelope[:fade_count] = np.linspace(0, 1, fade_count)
+        envelope[sample_count - fade_count:] = np.linspace(1, 0, fade_count)
+
+        samples = (tone * envelope * 0.3 * 32767).astype(np.int16)
+
+        out = io.BytesIO()
+        with wave.open(out, "wb") as wav:
+            wav.setnchannels(1)
+            wav.setsampwidth(2)
+            wav.setframerate(self.sample_rate)
+            wav.writeframes(samples.tobytes())
+        return out.getvalue()
+
+    def phrase_duration(self, text: str):
+        duration = self.base_duration_seconds
+        for character in text:
+            if character.isspace():
+                duration += self.seconds_per_character / 2
+            elif ord(character) > 0x2e80:
+                duration += self.seconds_per_wide_character
+            else:
+                duration += self.seconds_per_character
+        return duration
+
+
+class EspeakTTSBackend(TTSBackend):
+    # Wraps a locally installed espeak-ng (or espeak). Real speech, still fully offline.
+    name = "espeak"
+
+    def __init__(self):
+        self.executable = shutil.which("espeak-ng") or shutil.which("espeak")
+        if self.executable is None:
+            raise RuntimeError("espeak-ng or espeak needs to be installed for the espeak text to speech backend")
+
+    def synthesize(self, text: str, language_code: str, voice_name: str):
+        # espeak voices are named after the bare language, e.g. "ja" or "en-us"
+        voice = language_code.lower() if language_code.lower() in ("en-us", "en-gb") else language_code.split("-")[0]
+        result = subprocess.run([self.executable, "-v", voice, "--stdout", text], stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=True)
+        return result.stdout
+
+
+backend_names = [GoogleTTSBackend.name, LocalTTSBackend.name, EspeakTTSBackend.name]
+
+
+def create_backend(name: str, client_pool_size: int = 2):
+    if name == GoogleTTSBackend.name:
+        return GoogleTTSBackend(client_pool_size)
+    if name == LocalTTSBackend.name:
+        return LocalTTSBackend()
+    if name == EspeakTTSBackend.name:
+        return EspeakTTSBackend()
+    raise ValueError(f"unknown text to speech backend {name}")
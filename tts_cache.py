@@ -0,0 +1,102 @@
+import hashlib
+import json
+import os
+import tempfile
+import threading
+
+default_cache_dir = "cache/tts"
+default_cache_size_mb = 1024
+
+cache_entry_extension = ".wav"
+
+
+class TTSCache:
+    # Content addressed on-disk cache of synthesized audio. Entries are keyed by a hash of the
+    # request parameters and evicted least recently used first once the size limit is exceeded.
+
+    def __init__(self, cache_dir: str = default_cache_dir, size_limit_bytes: int = default_cache_size_mb * 1024 * 1024):
+        self.cache_dir = cache_dir
+        self.size_limit_bytes = size_limit_bytes
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self.total_size = sum(size for _, size, _ in self._entries())
+
+    def key(self, text: str, language_code: str, voice_name: str, encoding: str):
+        request_params = json.dumps([text, language_code, voice_name, encoding], ensure_ascii=False)
+        return hashlib.sha256(request_params.encode("utf-8")).hexdigest()
+
+    def path(self, key: str):
+        # fan out over sub directories so a large cache doesn't end up in a single directory
+        return os.path.join(self.cache_dir, key[:2], key + cache_entry_extension)
+
+    def get(self, key: str):
+        entry_path = self.path(key)
+        try:
+            with open(entry_path, "rb") as entry:
+                audio_content = entry.read()
+        except FileNotFoundError:
+            with self.lock:
+                self.misses += 1
+            return None
+
+        # bump the modification time, it is what the LRU eviction orders by
+        try:
+            os.utime(entry_path)
+        except FileNotFoundError:
+            pass
+        with self.lock:
+            self.hits += 1
+        return audio_content
+
+    def put(self, key: str, audio_content: bytes):
+        entry_path = self.path(key)
+        entry_directory = os.path.dirname(entry_path)
+        os.makedirs(entry_directory, exist_ok=True)
+
+        previous_size = os.path.getsize(entry_path) if os.path.exists(entry_path) else 0
+
+        # write to a temp file and rename it into place so a concurrent reader never sees a partial entry
+        fd, temp_path = tempfile.mkstemp(dir=entry_directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as out:
+                out.write(audio_content)
+            os.replace(temp_path, entry_path)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+
+        with self.lock:
+            self.total_size += len(audio_content) - previous_size
+            if self.total_size > self.size_limit_bytes:
+                self._evict()
+
+    def _evict(self):
+        entries = sorted(self._entries())
+        self.total_size = sum(size for _, size, _ in entries)
+
+        # trim down to 90% of the limit so that we don't have to evict again on the very next put
+        target_size = int(self.size_limit_bytes * 0.9)
+        for _, size, entry_path in entries:
+            if self.total_size <= target_size:
+                break
+            try:
+                os.remove(entry_path)
+            except FileNotFoundError:
+                pass
+            self.total_size -= size
+
+    def _entries(self):
+        for root, _, files in os.walk(self.cache_dir):
+            for name in files:
+                if not name.endswith(cache_entry_extension):
+                    continue
+                entry_path = os.path.join(root, name)
+                try:
+                    stat = os.stat(entry_path)
+                except FileNotFoundError:
+                    continue
+                yield (stat.st_mtime, stat.st_size, entry_path)
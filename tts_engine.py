@@ -0,0 +1,131 @@
+import concurrent.futures
+import random
+import threading
+import time
+
+from stage_profiler import call_with_profiler, current_profiler
+
+default_max_workers = 8
+default_client_pool_size = 2
+default_max_retries = 5
+default_backoff_seconds = 1.0
+
+# requests synthesized ahead of the one a deck's renderer is at, bounds the audio held in memory for long decks
+default_lookahead = 256
+
+
+def language_code_for_voice(voice: str):
+    return "-".join(voice.split("-")[:2])
+
+
+def synthesis_requests(source_to_target_list: list, source_voice: str, target_voice: str):
+    # the (text, language_code, voice_name) requests for a deck, in the order the renderers consume them
+    source_language_code = language_code_for_voice(source_voice)
+    target_language_code = language_code_for_voice(target_voice)
+
+    requests = []
+    for item in source_to_target_list:
+        requests.append((item[0], source_language_code, source_voice))
+        requests.append((item[1], target_language_code, target_voice))
+    return requests
+
+
+class SynthesisEngine:
+    # Runs synthesis for a text to speech backend on a bounded thread pool, in front of the on-disk cache.
+    # prefetch() queues up a whole deck, synthesize() hands the results back in whatever order the caller asks.
+    # plan() counts how often each request will be asked for, so a phrase that recurs across rows and decks
+    # is synthesized once and its result held until the last row that needs it.
+
+    def __init__(
+            self,
+            backend,
+            cache=None,
+            max_workers: int = default_max_workers,
+            max_retries: int = default_max_retries,
+            backoff_seconds: float = default_backoff_seconds
+    ):
+        self.backend = backend
+        self.cache = cache if backend.cacheable else None
+        self.retryable_errors = backend.retryable_errors()
+        self.max_retries = max_retries
+        self.backoff_seconds = backoff_seconds
+
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=max(1, max_workers), thread_name_prefix="tts")
+
+        self.pending = {}
+        self.planned_uses = {}
+        self.pending_lock = threading.Lock()
+
+    def synthesize(self, text: str, language_code: str, voice_name: str):
+        request = (text, language_code, voice_name)
+        with self.pending_lock:
+            future = self.pending.get(request)
+            remaining_uses = self.planned_uses.get(request, 1) - 1
+            if remaining_uses > 0:
+                self.planned_uses[request] = remaining_uses
+                if future is None:
+                    future = self.executor.submit(call_with_profiler, current_profiler(), self._synthesize, *request)
+                    self.pending[request] = future
+            else:
+                self.planned_uses.pop(request, None)
+                self.pending.pop(request, None)
+        if future is not None:
+            return future.result()
+        return self._synthesize(text, language_code, voice_name)
+
+    def plan(self, requests: list):
+        with self.pending_lock:
+            for request in requests:
+                self.planned_uses[request] = self.planned_uses.get(request, 0) + 1
+
+    def prefetch(self, requests: list, plan: bool = True):
+        # plan=False when the requests were already planned, e.g. as part of a whole batch
+        if plan:
+            self.plan(requests)
+        # the synthesis is accounted to whoever prefetched it first, e.g. the deck being planned
+        profiler = current_profiler()
+        with self.pending_lock:
+            for request in requests:
+                if request not in self.pending:
+                    self.pending[request] = self.executor.submit(call_with_profiler, profiler, self._synthesize, *request)
+
+    def prefetch_window(self, requests: list, position: int, lookahead: int = default_lookahead):
+        # For a deck consumed in order: queues the requests from position up to position + lookahead, so
+        # synthesis keeps running ahead of the renderer without the whole deck's audio piling up in memory.
+        # The requests have to be planned already.
+        self.prefetch(requests[position:position + lookahead], plan=False)
+
+    def close(self):
+        with self.pending_lock:
+            self.pending.clear()
+            self.planned_uses.clear()
+        self.executor.shutdown(wait=True, cancel_futures=True)
+
+    def _synthesize(self, text: str, language_code: str, voice_name: str):
+        cache_key = None
+        if self.cache is not None:
+            cache_key = self.cache.key(text, language_code, voice_name, "LINEAR16")
+            cached_audio_content = self.cache.get(cache_key)
+            if cached_audio_content is not None:
+                current_profiler().add("tts_cache_hit", calls=1, bytes_written=len(cached_audio_content))
+                return cached_audio_content
+
+        attempt = 0
+        while True:
+            try:
+                with current_profiler().stage("tts_backend"):
+                    audio_content = self.backend.synthesize(text, language_code, voice_name)
+                current_profiler().add("tts_backend", bytes_written=len(audio_content))
+                break
+            except self.retryable_errors as e:
+                if attempt >= self.max_retries:
+                    raise
+                # exponential backoff with jitter so the workers don't hit the quota again in lock step
+                delay = self.backoff_seconds * (2 ** attempt) * random.uniform(0.5, 1.5)
+                print(f"text to speech error for {text} ({e.__class__.__name__}), retrying in {delay:.1f}s")
+                time.sleep(delay)
+                attempt = attempt + 1
+
+        if self.cache is not None:
+            self.cache.put(cache_key, audio_content)
+        return audio_content
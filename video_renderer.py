@@ -0,0 +1,148 @@
+import os
+import subprocess
+import uuid
+import wave
+
+import imageio_ffmpeg as ffmpeg
+import numpy as np
+
+from encoding_profiles import EncodingProfile, x264_params
+
+default_canvas_size = (1280, 720)
+default_fps = 25
+default_sample_rate = 44100
+
+
+class SinglePassRenderer:
+    # Renders a whole deck with a single encoder process. Cards are added one at a time, their audio is
+    # appended to one track on disk and only the card text and timing are kept in memory. render() then
+    # streams every card's frame into ffmpeg, repeating it for as long as the card is on screen.
+
+    def __init__(
+            self,
+            output_file_path: str,
+            scratch_file_prefix: str,
+            canvas_size: tuple = default_canvas_size,
+            fps: int = default_fps,
+            sample_rate: int = default_sample_rate,
+            profile: EncodingProfile = None
+    ):
+        self.output_file_path = output_file_path
+        self.audio_file_path = scratch_file_prefix + "_track.wav"
+        self.log_file_path = scratch_file_prefix + "_ffmpeg.log"
+        # yuv420p needs even dimensions
+        self.canvas_size = (canvas_size[0] - canvas_size[0] % 2, canvas_size[1] - canvas_size[1] % 2)
+        self.profile = profile
+        self.fps = profile.fps if profile is not None else fps
+        self.sample_rate = sample_rate
+
+        self.cards = []
+        self.sample_count = 0
+
+        self.audio_track = wave.open(self.audio_file_path, "wb")
+        self.audio_track.setnchannels(2)
+        self.audio_track.setsampwidth(2)
+        self.audio_track.setframerate(self.sample_rate)
+
+    def add_timeline(self, timeline):
+        # appends an AudioTimeline, its parts go to the track on disk as they are and its cards keep their
+        # exact sample offsets, shifted to where the timeline starts in the deck
+        if timeline.sample_rate != self.sample_rate or timeline.channels != 2:
+            raise ValueError(f"timeline has to be stereo at {self.sample_rate}Hz")
+
+        timeline_start = self.sample_count
+        for part in timeline.parts:
+            self.audio_track.writeframes(memoryview(np.ascontiguousarray(part)).cast("B"))
+        self.sample_count = timeline_start + timeline.sample_count
+
+        for text, start, end in timeline.cards:
+            self.cards.append((text, timeline_start + start, timeline_start + end))
+
+    def render(self, rasterize):
+        # ffmpeg writes to a temp file next to the output that is renamed into place once it succeeds, so a
+        # failed render leaves the previous video untouched
+        self.audio_track.close()
+        output_directory = os.path.dirname(self.output_file_path) or "."
+        os.makedirs(output_directory, exist_ok=True)
+        temp_output_path = os.path.join(output_directory, f".{os.path.basename(self.output_file_path)}.{uuid.uuid4().hex}.tmp")
+
+        width, height = self.canvas_size
+        command = [
+            ffmpeg.get_ffmpeg_exe(), "-y", "-loglevel", "error",
+            "-f", "rawvideo", "-pix_fmt", "rgb24", "-s", f"{width}x{height}", "-r", str(self.fps), "-i", "pipe:0",
+            "-i", self.audio_file_path,
+            "-map", "0:v", "-map", "1:a",
+            "-c:v", "libx264", "-pix_fmt", "yuv420p", *self.video_codec_params(),
+            "-c:a", "aac", *self.audio_codec_params(),
+            "-shortest",
+            "-f", "mp4", temp_output_path,
+        ]
+
+        try:
+            with open(self.log_file_path, "wb") as log:
+                process = subprocess.Popen(command, stdin=subprocess.PIPE, stdout=subprocess.DEVNULL, stderr=log)
+                try:
+                    for text, start, end in self.cards:
+                        # place card boundaries on the frame grid from the absolute sample offsets, so rounding
+                        # never accumulates over a long deck
+                        frame_count = self.frame_index(end) - self.frame_index(start)
+                        if frame_count <= 0:
+                            continue
+                        # a held frame, the same buffer is written for every frame of the card without copying it
+                        frame_buffer = memoryview(np.ascontiguousarray(self.canvas_frame(rasterize(text)))).cast("B")
+                        for _ in range(frame_count):
+                            process.stdin.write(frame_buffer)
+                    process.stdin.close()
+                except BrokenPipeError:
+                    pass
+                except BaseException:
+                    # stop the encoder before its temp output is removed
+                    process.kill()
+                    process.wait()
+                    raise
+                return_code = process.wait()
+
+            if return_code != 0:
+                with open(self.log_file_path, "r", errors="replace") as log:
+                    raise RuntimeError(f"ffmpeg failed rendering {self.output_file_path}:\n{log.read()}")
+            os.replace(temp_output_path, self.output_file_path)
+        finally:
+            if os.path.exists(temp_output_path):
+                os.remove(temp_output_path)
+
+        os.remove(self.audio_file_path)
+        os.remove(self.log_file_path)
+        print(f"Rendered {self.output_file_path} with {len(self.cards)} cards")
+
+    def video_codec_params(self):
+        if self.profile is None:
+            return []
+        return ["-preset", self.profile.preset, *x264_params(self.profile)]
+
+    def audio_codec_params(self):
+        if self.profile is None or self.profile.audio_bitrate is None:
+            return []
+        return ["-b:a", self.profile.audio_bitrate]
+
+    def frame_index(self, sample_offset: int):
+        return int(round(sample_offset * self.fps / self.sample_rate))
+
+    def canvas_frame(self, frame):
+        # center the card on a black canvas, cropping it if it happens to be larger
+        width, height = self.canvas_size
+        if frame is not None and frame.shape == (height, width, 3):
+            return frame
+
+        canvas = np.zeros((height, width, 3), dtype=np.uint8)
+        if frame is None:
+            return canvas
+
+        frame = np.asarray(frame)[:, :, :3]
+        frame_height = min(frame.shape[0], height)
+        frame_width = min(frame.shape[1], width)
+        source_y = (frame.shape[0] - frame_height) // 2
+        source_x = (frame.shape[1] - frame_width) // 2
+        y = (height - frame_height) // 2
+        x = (width - frame_width) // 2
+        canvas[y:y + frame_height, x:x + frame_width] = frame[source_y:source_y + frame_height, source_x:source_x + frame_width]
+        return canvas
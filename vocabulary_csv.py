@@ -0,0 +1,138 @@
+import csv
+import operator
+from collections.abc import Sequence
+
+general_schema = "general"
+japanese_schema = "japanese"
+
+
+class VocabularyEntry:
+    # One row of a deck, line_number points back at the row in the input file. Entries use __slots__ so a
+    # combined corpus of tens of thousands of rows is held once as compact objects, the pair lists the
+    # renderers and csv exports work on are PairViews onto them rather than copies.
+    __slots__ = ("line_number",)
+    columns = ()
+
+    def __repr__(self):
+        fields = ", ".join(f"{column}={getattr(self, column)!r}" for column in self.columns)
+        return f"{type(self).__name__}({fields}, line_number={self.line_number})"
+
+
+class GeneralEntry(VocabularyEntry):
+    __slots__ = ("source", "target")
+    columns = ("source", "target")
+
+    def __init__(self, source: str, target: str, line_number: int):
+        self.source = source
+        self.target = target
+        self.line_number = line_number
+
+
+class JapaneseEntry(VocabularyEntry):
+    __slots__ = ("kanji", "kana", "english")
+    columns = ("kanji", "kana", "english")
+
+    def __init__(self, kanji: str, kana: str, english: str, line_number: int):
+        self.kanji = kanji
+        self.kana = kana
+        self.english = english
+        self.line_number = line_number
+
+
+class PairView(Sequence):
+    # A read only list of (first, second) tuples projected from two columns of the entries. Reversing or
+    # projecting a different pair of columns makes another view on the same entries, nothing is copied.
+    __slots__ = ("entries", "first_column", "second_column", "project")
+
+    def __init__(self, entries: list, first_column: str, second_column: str):
+        self.entries = entries
+        self.first_column = first_column
+        self.second_column = second_column
+        self.project = operator.attrgetter(first_column, second_column)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self.project(entry) for entry in self.entries[index]]
+        return self.project(self.entries[index])
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __iter__(self):
+        return map(self.project, self.entries)
+
+    def reversed(self):
+        return PairView(self.entries, self.second_column, self.first_column)
+
+schema_entries = {
+    general_schema: GeneralEntry,
+    japanese_schema: JapaneseEntry,
+}
+
+
+def detect_schema(fields: list):
+    # kanji,kana,english decks have exactly three columns, anything else is read as source,target
+    return japanese_schema if len(fields) == 3 else general_schema
+
+
+class VocabularyReader:
+    # Streams the rows of a vocabulary CSV through csv.reader, so quoted fields, CRLF line endings and a
+    # UTF-8 BOM are handled and the file is never held in memory as a whole. The schema is detected from
+    # the first row of the same pass, rows that don't fit it are reported with their line number and skipped.
+
+    def __init__(self, csv_file_path: str, schema: str = None):
+        self.csv_file_path = csv_file_path
+        self.file = open(csv_file_path, "r", encoding="utf-8-sig", newline="")
+        self.reader = csv.reader(self.file)
+        self.bad_rows = []
+
+        # the first row is read here to detect the schema and handed out again by rows()
+        self.first_row = self.next_fields()
+        self.column_count = len(self.first_row[1]) if self.first_row is not None else 0
+        self.schema = schema
+        if self.schema is None:
+            self.schema = detect_schema(self.first_row[1]) if self.first_row is not None else general_schema
+
+    def next_fields(self):
+        try:
+            for fields in self.reader:
+                fields = [field.strip() for field in fields]
+                if any(fields):
+                    return self.reader.line_num, fields
+        except csv.Error as e:
+            raise ValueError(f"{self.csv_file_path} line {self.reader.line_num}: {e}")
+        return None
+
+    def rows(self, schema: str = None):
+        # Yields one entry per row for the given schema, the detected one by default. Rows can only be read once.
+        entry_type = schema_entries[schema or self.schema]
+        column_count = len(entry_type.columns)
+
+        pending_row = self.first_row
+        self.first_row = None
+        while pending_row is not None:
+            line_number, fields = pending_row
+            if len(fields) < column_count:
+                self.report_bad_row(line_number, f"expected {column_count} columns, got {len(fields)}")
+            elif not all(fields[:column_count]):
+                self.report_bad_row(line_number, "empty column")
+            else:
+                yield entry_type(*fields[:column_count], line_number)
+            pending_row = self.next_fields()
+
+    def report_bad_row(self, line_number: int, message: str):
+        self.bad_rows.append((line_number, message))
+        print(f"Skipping {self.csv_file_path} line {line_number}: {message}")
+
+    def __iter__(self):
+        return self.rows()
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False